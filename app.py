@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 from io import BytesIO
 from datetime import datetime
-import shutil
-from final import main, color_check_cells, copy_sheet
+import os
+import time
+from jobs import JobManager
 
 # Page configuration
 st.set_page_config(
@@ -29,7 +30,7 @@ st.info(
 
 with st.expander("ℹ️ How to use this app"):
     st.markdown("""
-    **Step 1:** Upload your Excel file using the file uploader above.  
+    **Step 1:** Upload your Excel file using the file uploader above. SORs you only have as PDFs can be added under "SOR PDFs", each one picked for its HEADER COMPARISON column.  
     **Step 2:** Wait for the app to process and extract the data.  
     **Step 3:** Preview the extracted or compared data on the screen.  
     **Step 4:** Click the download button to save the final Excel output.  
@@ -48,37 +49,85 @@ st.divider()
 # Upload Section
 uploaded_file = st.file_uploader("📤 Upload your Excel file", type=["xlsx", "xls"])
 
+# One bounded worker pool and result cache shared by every session
+@st.cache_resource
+def job_manager():
+    return JobManager()
+
 if uploaded_file:
     status_msg = st.empty()  # Create a placeholder for status updates
-    status_msg.success("✅ File uploaded. Running comparison...")
-
-    # Set output path
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    date = datetime.today().strftime('%d_%b_%y')
-    input_path = f"input_{timestamp}.xlsx"
-    output_path = f"ACMV_{date}.xlsx"
 
-    with open(input_path, "wb") as f:
-        f.write(uploaded_file.read())
+    # Download name; nothing is written to the shared volume, so sessions cannot overwrite each other
+    timestamp = datetime.now().strftime("%d_%b_%y-%H%M%S")
+    output_path = f"ACMV_{os.path.splitext(uploaded_file.name)[0]}_{timestamp}.xlsx"
+
+    # SORs that only exist as PDFs are read straight from the PDF for the chosen HEADER COMPARISON column
+    pdfs = {}
+    with st.expander("📄 SOR PDFs (optional)"):
+        try:
+            header = pd.read_excel(BytesIO(uploaded_file.getvalue()), sheet_name="HEADER COMPARISON", nrows=0)
+            # The columns main compares, named as main strips them
+            sor_columns = [str(column).strip() for column in header.columns[2:] if "SOR" in str(column).upper()]
+        except ValueError:
+            sor_columns = []
+        pdf_files = st.file_uploader("Upload SOR PDFs", type=["pdf"], accept_multiple_files=True)
+        for pdf_file in pdf_files or []:
+            if not sor_columns:
+                st.warning("No SOR columns found in the HEADER COMPARISON sheet")
+                break
+            stem = os.path.splitext(pdf_file.name)[0].lower()
+            default = next((n for n, column in enumerate(sor_columns) if stem in column.lower()), 0)
+            column = st.selectbox(f"SOR column for {pdf_file.name}", sor_columns, index=default, key=pdf_file.name)
+            pdfs[column] = pdf_file.getvalue()
+
+    # Reruns and repeat uploads of the same files attach to the same job or its cached result
+    job = job_manager().submit(uploaded_file.getvalue(), pdfs or None)
+    if not job.done:
+        status_msg.success("✅ File uploaded. Running comparison...")
+        progress_bar = st.progress(0.0, text="Waiting for a free worker...")
+        while not job.done:
+            event = job.progress()
+            if event and event["total"]:
+                progress_bar.progress(min(event["done"] / event["total"], 1.0),
+                                      text=f"{event['sheet']}: {event['done']} of {event['total']} header groups compared")
+            time.sleep(0.5)
+        progress_bar.empty()
 
     try:
-        main(input_path, output_path)
-        color_check_cells(output_path)
-        copy_sheet(input_path, output_path)
+        output, report = job.result()
         # st.success("✅ Excel comparison completed!")
-        status_msg.success("✅ Excel comparison completed!")
+        status_msg.success("✅ Excel comparison completed!" if job.status != "cached" else "✅ Loaded the earlier result for this file")
 
         # Load and display results
-        df = pd.read_excel("output.xlsx", sheet_name="ACMV")
+        df = pd.read_excel(BytesIO(output), sheet_name="ACMV")
         st.dataframe(df, use_container_width=True)
 
-        with open(output_path, "rb") as file:
-            st.download_button(
-                label="📥 Download Result File",
-                data=file,
-                file_name=output_path,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        st.download_button(
+            label="📥 Download Result File",
+            data=output,
+            file_name=output_path,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+        # Where the time went
+        with st.expander(f"⏱️ Run timings ({report['wall_seconds']:.1f}s)"):
+            st.markdown("**Per stage**")
+            st.dataframe(pd.DataFrame(report["stages"]).T, use_container_width=True)
+            st.markdown("**Per SOR sheet**")
+            sheets = pd.DataFrame({sheet: {name: totals["seconds"] for name, totals in stages.items()}
+                                   for sheet, stages in report["sheets"].items()}).T
+            st.dataframe(sheets, use_container_width=True)
+            st.markdown("**Slowest header groups**")
+            groups = pd.DataFrame([{"sheet": group["sheet"], "group": group["group"],
+                                    "seconds": sum(totals["seconds"] for totals in group["stages"].values()),
+                                    "rows": group["stages"].get("match", {}).get("rows", 0)}
+                                   for group in report["groups"]])
+            if not groups.empty:
+                st.dataframe(groups.sort_values("seconds", ascending=False).head(20), use_container_width=True)
+            # Peak memory, and the base sheet size and limit when the low-memory reader ran
+            if report.get("memory"):
+                st.markdown("**Memory**")
+                st.dataframe(pd.Series(report["memory"], name="value"), use_container_width=True)
 
     except Exception as e:
         st.error(f"⚠️ An error occurred: {e}")
@@ -0,0 +1,265 @@
+# batch.py
+# Compare many workbooks without the Streamlit app:
+#
+#   python batch.py projects/*.xlsx -o results
+#   python batch.py projects/ archive/2024 -o results --jobs 4 --timings
+#   python batch.py projects/*.xlsx -o results --pdf "SOR 2 (Vendor)=schedule.pdf"
+#
+# Inputs can be files, directories (their .xlsx/.xls files) or glob patterns.
+# Each workbook runs in its own pool process; one that fails is recorded in the
+# manifest and the rest of the batch carries on.
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import Manager
+from final import compare_workbook, pdf_sor
+from instrumentation import Instrumentation
+from matching import Blocking
+from catalogue import CatalogueStore
+from workbook import parse_size, HIGHLIGHT_MODES
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+
+
+# Files, directories and glob patterns -> sorted, de-duplicated workbook paths
+def expand_inputs(inputs, recursive=False):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif glob.has_magic(item):
+            candidates = glob.glob(item, recursive=True)
+        else:
+            candidates = [item]
+        for path in candidates:
+            name = os.path.basename(path)
+            # Skip Excel's lock files ("~$book.xlsx") and non-workbooks found in directories
+            if name.startswith("~$") or not name.lower().endswith(EXCEL_EXTENSIONS):
+                if path == item:
+                    paths.append(path)  # named explicitly: let it fail visibly in the manifest
+                continue
+            paths.append(path)
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return sorted(unique)
+
+
+# ACMV_<input name>.xlsx in output_dir, with _2, _3... when the name is taken
+# by an existing file or by another input with the same name
+def output_name(path, output_dir, taken):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    candidate = os.path.join(output_dir, f"ACMV_{stem}.xlsx")
+    n = 1
+    while candidate.lower() in taken or os.path.exists(candidate):
+        n += 1
+        candidate = os.path.join(output_dir, f"ACMV_{stem}_{n}.xlsx")
+    taken.add(candidate.lower())
+    return candidate
+
+
+# Runs in a pool process. Never raises: failures come back as an "error" entry.
+# started (a Manager dict) records the path as soon as a worker picks it up.
+def process_file(path, output, options, timings=False, started=None):
+    if started is not None:
+        started[path] = True
+    entry = {"input": path, "output": output, "status": "ok"}
+    instrument = Instrumentation()
+    start = time.perf_counter()
+    try:
+        # The pipeline prints per-group progress; keep the batch log readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            data = compare_workbook(path, instrument=instrument, **options)
+        # Written in one go, so a failed run never leaves a half-written workbook behind
+        tmp = f"{output}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, output)
+        if timings:
+            entry["timings"] = instrument.write_report(output)
+    except Exception as e:
+        if os.path.exists(f"{output}.{os.getpid()}.tmp"):
+            os.remove(f"{output}.{os.getpid()}.tmp")
+        entry.update(status="error", output=None, error=f"{type(e).__name__}: {e}",
+                     traceback=traceback.format_exc(limit=5))
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+
+    report = instrument.report()
+    stages = report["stages"]
+    entry["rows"] = {
+        "read": stages.get("load", {}).get("rows", 0),
+        "compared": stages.get("compare", {}).get("rows", 0),
+        "matched": stages.get("match", {}).get("matches", 0),
+    }
+    entry["sheets"] = len(report["sheets"])
+    entry["memory"] = report["memory"]
+    return entry
+
+
+# One pool over items ((path, output) pairs), passing each entry to record.
+# A worker that dies breaks the whole pool; the items no worker had started
+# and those that were running are then returned, in submission order.
+def _run_pool(items, jobs, options, timings, started, record):
+    for path, _ in items:
+        started.pop(path, None)
+    unstarted, running = [], []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(process_file, path, output, options, timings, started): (path, output)
+                   for path, output in items}
+        for future in as_completed(futures):
+            path, output = futures[future]
+            try:
+                record(future.result())
+            except BrokenProcessPool:
+                (running if path in started else unstarted).append((path, output))
+            except Exception as e:
+                record({"input": path, "output": None, "status": "error", "error": f"{type(e).__name__}: {e}"})
+    order = {item: n for n, item in enumerate(items)}
+    unstarted.sort(key=order.get)
+    running.sort(key=order.get)
+    if not running and unstarted:
+        # Died before recording its start: with one worker that is the first left
+        running = unstarted[:1] if jobs == 1 else unstarted
+        unstarted = unstarted[1:] if jobs == 1 else []
+    return unstarted, running
+
+
+# Each SOR PDF in options["pdfs"] is extracted once, here, and the workers get
+# the item frames rather than re-extracting the same PDF for every workbook.
+def run_batch(paths, output_dir, jobs=None, options=None, timings=False, log=print):
+    os.makedirs(output_dir, exist_ok=True)
+    options = options or {}
+    taken = set()
+    outputs = [output_name(path, output_dir, taken) for path in paths]
+    started = datetime.now()
+    start = time.perf_counter()
+    entries = {}
+
+    def record(entry):
+        entries[entry["input"]] = entry
+        detail = os.path.basename(entry["output"]) if entry["status"] == "ok" else entry["error"]
+        log(f"[{len(entries)}/{len(paths)}] {entry['status']:<5} {entry['input']} -> {detail} ({entry.get('seconds', 0):.1f}s)")
+
+    todo = list(zip(paths, outputs))
+    worker_options = options
+    if options.get("pdfs"):
+        pdfs = {}
+        try:
+            for name, source in options["pdfs"].items():
+                extract_start = time.perf_counter()
+                pdfs[name] = pdf_sor(source, options.get("pdf_options"))
+                log(f"{name}: {len(pdfs[name])} items extracted ({time.perf_counter() - extract_start:.1f}s)")
+            worker_options = dict(options, pdfs=pdfs)
+        except Exception as e:
+            # Every workbook needs the PDF, so every workbook fails with its error
+            for path, _ in todo:
+                record({"input": path, "output": None, "status": "error", "error": f"{type(e).__name__}: {e}",
+                        "traceback": traceback.format_exc(limit=5)})
+            todo = []
+
+    # A worker that dies (e.g. killed for running out of memory) must not take
+    # the rest of the batch with it. Workbooks no worker had started go into a
+    # fresh pool. If one workbook was running, it is the one that crashed; if
+    # several were, they are re-run one at a time so only the culprit fails.
+    isolated = []
+    with Manager() as manager:
+        running_paths = manager.dict()
+        while todo or isolated:
+            alone = not todo
+            unstarted, crashed = _run_pool(isolated if alone else todo, 1 if alone else jobs,
+                                           worker_options, timings, running_paths, record)
+            if alone or len(crashed) == 1:
+                for path, _ in crashed:
+                    record({"input": path, "output": None, "status": "error",
+                            "error": "BrokenProcessPool: the worker process died (e.g. killed for running out of memory)"})
+            else:
+                isolated += crashed
+            if alone:
+                isolated = unstarted
+            else:
+                todo = unstarted
+
+    files = [entries[path] for path in paths]
+    return {
+        "started": started.isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - start, 3),
+        "jobs": jobs or os.cpu_count(),
+        "options": {key: repr(value) for key, value in options.items()},
+        "ok": sum(entry["status"] == "ok" for entry in files),
+        "failed": sum(entry["status"] != "ok" for entry in files),
+        "files": files,
+    }
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Compare a batch of SOR workbooks")
+    parser.add_argument("inputs", nargs="+", help="workbooks, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="output", help="where the ACMV_*.xlsx files go")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="workbooks processed at once (default: CPU count)")
+    parser.add_argument("--recursive", action="store_true", help="also look in sub-directories of input directories")
+    parser.add_argument("--manifest", help="manifest path (default: <output-dir>/manifest.json)")
+    parser.add_argument("--backend", help="matching backend, e.g. rapidfuzz")
+    parser.add_argument("--blocking", action="store_true", help="score only candidate matches (see matching.Blocking)")
+    parser.add_argument("--catalogues", metavar="DIR", help="read SORs imported with catalogue.py from DIR")
+    parser.add_argument("--pdf", action="append", default=[], metavar="SOR=PDF",
+                        help="read the HEADER COMPARISON column SOR from a PDF instead of a sheet (repeatable)")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="read the base sheet once in compact types and write the output row by row")
+    parser.add_argument("--memory-limit", metavar="SIZE",
+                        help="fail a workbook whose base sheet needs more than SIZE, e.g. 2GB (implies --low-memory)")
+    parser.add_argument("--highlight", choices=HIGHLIGHT_MODES, default="cells",
+                        help="fill each flagged cell, or use conditional formatting rules (smaller, faster to write)")
+    parser.add_argument("--timings", action="store_true", help="write a .timings.json report next to every output")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs, args.recursive)
+    if not paths:
+        print("No workbooks found")
+        return 1
+
+    options = {}
+    if args.backend:
+        options["backend"] = args.backend
+    if args.blocking:
+        options["blocking"] = Blocking()
+    if args.catalogues:
+        options["catalogues"] = CatalogueStore(args.catalogues)
+    if args.highlight != "cells":
+        options["highlight"] = args.highlight
+    if args.low_memory:
+        options["low_memory"] = True
+    if args.memory_limit:
+        options["memory_limit"] = parse_size(args.memory_limit)
+    if args.pdf:
+        pdfs = {}
+        for item in args.pdf:
+            name, sep, path = item.rpartition("=")
+            if not sep or not name:
+                parser.error(f"--pdf expects SOR=PDF, got '{item}'")
+            pdfs[name] = path
+        options["pdfs"] = pdfs
+
+    manifest = run_batch(paths, args.output_dir, args.jobs, options, args.timings)
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{manifest['ok']} compared, {manifest['failed']} failed in {manifest['seconds']:.1f}s. Manifest: {manifest_path}")
+    return 0 if manifest["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,207 @@
+# benchmarks/bench.py
+# Timed scenarios for matching, workbook I/O and PDF extraction on synthetic data.
+#
+#   python -m benchmarks.bench                         # run and print timings
+#   python -m benchmarks.bench --save-baseline         # store timings as the baseline
+#   python -m benchmarks.bench --threshold 0.25        # fail if >25% slower than the baseline
+#
+# Runs fully offline; everything is generated into a temporary directory.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import synthetic
+from final import main, compare, color_check_cells, choice_corpus
+from matching import Blocking, blocking_recall, rf_process
+from workbook import WorkbookLoader, OutputBuilder
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Problem sizes per profile
+PROFILES = {
+    "quick": {"group_rows": 150, "acmv_rows": 200, "sor_count": 2, "headers": 4, "pdf_pages": 20},
+    "full": {"group_rows": 1000, "acmv_rows": 2000, "sor_count": 6, "headers": 10, "pdf_pages": 200},
+}
+
+
+# report, when given, returns extra figures about the scenario (not timed),
+# kept under "report" in its result
+class Scenario:
+    def __init__(self, name, run, setup=None, params=None, report=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.params = params or {}
+        self.report = report
+
+
+def build_scenarios(workdir, sizes, similarity):
+    workbook_path = synthetic.make_workbook(
+        os.path.join(workdir, "input.xlsx"), sizes["acmv_rows"], sizes["sor_count"], sizes["headers"], similarity)
+    acmv_group, sor_group = synthetic.make_group(sizes["group_rows"], sizes["group_rows"], similarity)
+    workbook_params = {k: sizes[k] for k in ("acmv_rows", "sor_count", "headers")}
+    group_params = {"rows": sizes["group_rows"], "similarity": similarity}
+
+    def built_output():
+        builder = OutputBuilder()
+        with WorkbookLoader(workbook_path) as book:
+            main(book, builder)
+            color_check_cells(builder)
+        return builder
+
+    def saved_output():
+        output = os.path.join(workdir, "output.xlsx")
+        main(workbook_path, output)
+        return output
+
+    scenarios = [
+        Scenario("match.fuzzywuzzy", lambda _: compare(acmv_group, sor_group, "SOR"), params=group_params),
+        # What blocking gives up against exhaustive matching on the same group
+        Scenario("match.blocking", lambda _: compare(acmv_group, sor_group, "SOR", blocking=Blocking()), params=group_params,
+                 report=lambda: blocking_recall([str(d) for d in acmv_group["DESCRIPTION"]], choice_corpus(sor_group),
+                                                Blocking())),
+        Scenario("workbook.load", lambda _: WorkbookLoader(workbook_path).sheets(), params=workbook_params),
+        Scenario("workbook.main", lambda _: main(WorkbookLoader(workbook_path), OutputBuilder()), params=workbook_params),
+        Scenario("workbook.write", lambda builder: builder.write(os.path.join(workdir, "written.xlsx")),
+                 setup=built_output, params=workbook_params),
+        Scenario("workbook.color_check_cells", color_check_cells, setup=saved_output, params=workbook_params),
+    ]
+    if rf_process is not None:
+        scenarios.insert(1, Scenario("match.rapidfuzz", lambda _: compare(acmv_group, sor_group, "SOR", backend="rapidfuzz"),
+                                     params=group_params))
+
+    try:
+        import sor_converter
+    except ImportError:  # PyMuPDF not installed
+        print("Skipping PDF scenarios: PyMuPDF is not installed")
+        return scenarios
+    pdf_path = synthetic.make_pdf(os.path.join(workdir, "sor.pdf"), sizes["pdf_pages"])
+    pdf_params = {"pages": sizes["pdf_pages"]}
+    workers = min(4, os.cpu_count() or 1)
+    scenarios += [
+        Scenario("pdf.extract", lambda _: sor_converter.extract_structured_items_from_pdf(pdf_path), params=pdf_params),
+        Scenario("pdf.extract_parallel", lambda _: sor_converter.extract_structured_items_from_pdf(pdf_path, workers=workers),
+                 params={**pdf_params, "workers": workers}),
+    ]
+    return scenarios
+
+
+# Median/min wall time over `repeat` runs, plus the traced peak of one extra run
+def measure(scenario, repeat):
+    times = []
+    for _ in range(repeat):
+        state = scenario.setup()
+        start = time.perf_counter()
+        scenario.run(state)
+        times.append(time.perf_counter() - start)
+
+    state = scenario.setup()
+    tracemalloc.start()
+    scenario.run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        "seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "peak_mb": peak / 1e6,
+        "repeat": repeat,
+        "params": scenario.params,
+    }
+    if scenario.report is not None:
+        result["report"] = scenario.report()
+    return result
+
+
+# Scenarios slower (or hungrier) than the baseline by more than threshold, and
+# any drop in blocking recall (the data is generated, so recall is deterministic)
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None or previous.get("params") != result["params"]:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], result[metric]))
+        recall, previous_recall = (r.get("report", {}).get("recall") for r in (result, previous))
+        if recall is not None and previous_recall is not None and recall < previous_recall:
+            regressions.append((name, "recall", previous_recall, recall))
+    return regressions
+
+
+def run(profile="quick", repeat=3, similarity=0.7, only=None):
+    sizes = PROFILES[profile]
+    results = {
+        "meta": {
+            "profile": profile,
+            "similarity": similarity,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+        },
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            scenarios = build_scenarios(workdir, sizes, similarity)
+        for scenario in scenarios:
+            if only and not any(scenario.name.startswith(prefix) for prefix in only):
+                continue
+            # The pipeline prints progress; keep the benchmark output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(scenario, repeat)
+            results["scenarios"][scenario.name] = result
+            recall = f"  recall {result['report']['recall']:.3f}" if "recall" in result.get("report", {}) else ""
+            print(f"{scenario.name:<30} {result['seconds']:>9.3f}s  (min {result['min_seconds']:.3f}s)  peak {result['peak_mb']:>8.1f} MB{recall}")
+    return results
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SOR comparison pipeline on synthetic data")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--similarity", type=float, default=0.7, help="0.0 (unrelated) to 1.0 (identical wording)")
+    parser.add_argument("--only", nargs="*", help="run only scenarios starting with these prefixes, e.g. match pdf")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.profile, args.repeat, args.similarity, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline stored yet; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.3f} -> {after:.3f} ({after / before - 1:+.0%})")
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
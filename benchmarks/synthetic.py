@@ -0,0 +1,115 @@
+# benchmarks/synthetic.py
+# Offline generators for SOR workbooks and SOR PDFs used by the benchmarks
+
+import random
+import pandas as pd
+
+WORDS = (
+    "supply install deliver test commission galvanised steel copper pipe duct ductwork chiller FCU AHU "
+    "fan coil unit valve damper grille diffuser insulated flexible motorised fire rated volume control "
+    "condensate drain bracket hanger support 15mm 25mm 50mm 100mm 300mm 450mm 600mm thermostat sensor "
+    "exhaust fresh air return supply cassette split inverter compressor pump header strainer"
+).split()
+
+HEADERS = [
+    "DUCTWORK", "CHILLED WATER PIPING", "AIR HANDLING UNITS", "FAN COIL UNITS", "DAMPERS",
+    "GRILLES AND DIFFUSERS", "EXHAUST FANS", "SPLIT UNITS", "PUMPS", "INSULATION", "CONTROLS", "CONDENSATE",
+]
+
+UNITS = ["m", "No", "Set", "Each", "Lot", "kg"]
+
+
+def _description(rng, base, extra):
+    return " ".join([base] + rng.sample(WORDS, extra))
+
+
+# Reword a description: each word is kept with probability `similarity`
+def _reword(rng, description, similarity):
+    words = [w if rng.random() < similarity else rng.choice(WORDS) for w in description.split()]
+    return " ".join(words)
+
+
+# Workbook in the README layout: 'INPUT 1 (ACMV)', 'HEADER COMPARISON' and
+# 'SOR n (Vendor n)' sheets. acmv_rows are spread over `headers` header groups;
+# SOR groups are reworded copies of the ACMV groups (similarity 1.0 = identical
+# wording, 0.0 = unrelated) with a few rows more or fewer so both the
+# 'Too many ACMV' and 'SOR n Additionals' paths are exercised.
+def make_workbook(path, acmv_rows=500, sor_count=3, headers=8, similarity=0.7, seed=0):
+    rng = random.Random(seed)
+    headers = HEADERS[:headers] if headers <= len(HEADERS) else HEADERS + [f"SECTION {n}" for n in range(headers - len(HEADERS))]
+    per_group = max(1, acmv_rows // len(headers))
+
+    acmv = []
+    groups = {}
+    for header in headers:
+        base = " ".join(rng.sample(WORDS, 3))
+        groups[header] = [_description(rng, base, rng.randint(3, 8)) for _ in range(per_group)]
+        for description in groups[header]:
+            acmv.append({"HEADER NAME": header, "DESCRIPTION": description,
+                         "UNIT": rng.choice(UNITS), "RATE": round(rng.uniform(5, 5000), 2)})
+
+    comparison = pd.DataFrame({"NO": range(1, len(headers) + 1), "ACMV": headers})
+    sheets = {}
+    for n in range(1, sor_count + 1):
+        name = f"SOR {n} (Vendor {n})"
+        rows = []
+        for g, header in enumerate(headers):
+            # The first group always has spare SOR rows, the others vary
+            size = per_group + 2 if g == 0 else max(1, per_group + rng.randint(-2, 2))
+            source = groups[header]
+            for k in range(size):
+                description = _reword(rng, source[k % len(source)], similarity)
+                rows.append({"HEADER NAME": f"SECTION {header}", "DESCRIPTION": description,
+                             "UNIT": rng.choice(UNITS), "RATE": round(rng.uniform(5, 5000), 2)})
+        sheets[name] = pd.DataFrame(rows)
+        comparison[name] = [header.lower() for header in headers]
+
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame(acmv).to_excel(writer, sheet_name="INPUT 1 (ACMV)", index=False)
+        comparison.to_excel(writer, sheet_name="HEADER COMPARISON", index=False)
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return path
+
+
+# One ACMV header group and one SOR header group as DataFrames, for matching benchmarks
+def make_group(acmv_rows=500, sor_rows=500, similarity=0.7, seed=0):
+    rng = random.Random(seed)
+    base = " ".join(rng.sample(WORDS, 3))
+    acmv = [_description(rng, base, rng.randint(3, 8)) for _ in range(acmv_rows)]
+    sor = [_reword(rng, acmv[k % acmv_rows], similarity) for k in range(sor_rows)]
+    frame = lambda descriptions: pd.DataFrame({
+        "HEADER NAME": "GROUP", "DESCRIPTION": descriptions,
+        "UNIT": [rng.choice(UNITS) for _ in descriptions],
+        "RATE": [round(rng.uniform(5, 5000), 2) for _ in descriptions],
+    })
+    return frame(acmv), frame(sor)
+
+
+# SOR PDF in the layout sor_converter expects: section codes like A110000
+# followed by header lines, and item lines 'A1100010 description Unit $1,234.00'
+def make_pdf(path, pages=50, lines_per_page=45, seed=0):
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    section = item = 0
+    for _ in range(pages):
+        lines = []
+        while len(lines) < lines_per_page:
+            roll = rng.random()
+            if roll < 0.04:
+                section += 1
+                lines.append(f"A{10 + section % 80:02d}{section % 100:02d}00")
+                lines += [" ".join(rng.sample(WORDS, 3)).upper() for _ in range(rng.randint(3, 8))]
+            elif roll < 0.8:
+                item += 1
+                rate = f"{rng.uniform(1, 20000):,.2f}"
+                lines.append(f"A{item:07d} {' '.join(rng.sample(WORDS, 6))} {rng.choice(UNITS + [''])} ${rate}")
+            else:
+                lines.append(" ".join(rng.sample(WORDS, 5)))
+        page = doc.new_page()
+        page.insert_text((20, 24), "\n".join(lines[:lines_per_page]), fontsize=7)
+    doc.save(path)
+    doc.close()
+    return path
@@ -0,0 +1,202 @@
+# catalogue.py
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from final import HeaderIndex, clean_description_column
+from workbook import open_workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # without pyarrow catalogues are stored as pickles
+    feather = None
+
+# Where catalogues live unless a directory is passed in
+DEFAULT_CATALOGUE_DIR = os.environ.get(
+    "SOR_CATALOGUE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sor-comparison", "catalogues"))
+
+# Bump when the stored header index / cleaned descriptions change shape
+CATALOGUE_VERSION = 1
+
+
+# Directory name for a catalogue: readable part plus a hash so names never collide
+def _slug(name):
+    readable = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:40]
+    return f"{readable}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+# SOR catalogues imported once from a workbook sheet or a PDF and kept as
+# Feather files (memory-mapped on load; numeric columns stay in the map),
+# with the header groups and their clean descriptions precomputed. Catalogues are looked up by name, which is
+# the SOR sheet name final.main sees in the HEADER COMPARISON sheet.
+class CatalogueStore:
+    def __init__(self, directory=None):
+        self.directory = directory or DEFAULT_CATALOGUE_DIR
+        self._loaded = {}
+
+    def _path(self, name, filename=""):
+        return os.path.join(self.directory, _slug(name), filename)
+
+    def __contains__(self, name):
+        return os.path.exists(self._path(name, "meta.json"))
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        names = []
+        for entry in sorted(os.listdir(self.directory)):
+            meta = os.path.join(self.directory, entry, "meta.json")
+            if os.path.exists(meta):
+                with open(meta) as f:
+                    names.append(json.load(f)["name"])
+        return names
+
+    def info(self, name):
+        with open(self._path(name, "meta.json")) as f:
+            return json.load(f)
+
+    # Store df under name, replacing any catalogue of that name
+    def import_frame(self, name, df, source=None):
+        df = df.reset_index(drop=True)
+        df.columns = [str(column) for column in df.columns]
+        index = HeaderIndex(df)
+        cleaned = [clean_description_column(df.iloc[rows]).tolist() for rows in index.positions]
+
+        directory = self._path(name)
+        tmp = f"{directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        format = _write_frame(df, tmp)
+        with open(os.path.join(tmp, "index.pkl"), "wb") as f:
+            pickle.dump({"version": CATALOGUE_VERSION, "headers": index.headers,
+                         "positions": index.positions, "cleaned": cleaned}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            "name": name,
+            "source": source,
+            "format": format,
+            "rows": len(df),
+            "columns": list(df.columns),
+            "headers": len(index.headers),
+            "imported": datetime.now().isoformat(timespec="seconds"),
+            "version": CATALOGUE_VERSION,
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        # Swap the finished directory in so readers never see a half-written catalogue
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+        self._loaded.pop(name, None)
+        return meta
+
+    # sheet defaults to the catalogue name; workbook is a path, buffer, bytes or WorkbookLoader
+    def import_sheet(self, name, workbook, sheet=None):
+        book = open_workbook(workbook)
+        df = book.sheet(sheet or name)
+        source = workbook if isinstance(workbook, (str, os.PathLike)) else None
+        return self.import_frame(name, df, source=f"{source}:{sheet or name}" if source else sheet or name)
+
+    # Items from sor_converter, mapped to HEADER NAME / DESCRIPTION / UNIT / RATE
+    def import_pdf(self, name, pdf_path, **extract_options):
+        import sor_converter  # needs PyMuPDF
+        source = pdf_path if isinstance(pdf_path, (str, os.PathLike)) else None
+        return self.import_frame(name, sor_converter.extract_sor(pdf_path, **extract_options), source=source)
+
+    def load(self, name):
+        return self.header_index(name).df
+
+    # HeaderIndex over the stored frame with the precomputed groups and clean descriptions
+    def header_index(self, name):
+        if name not in self._loaded:
+            if name not in self:
+                raise KeyError(f"No catalogue named '{name}' in {self.directory}")
+            meta = self.info(name)
+            df = _read_frame(self._path(name), meta["format"])
+            with open(self._path(name, "index.pkl"), "rb") as f:
+                stored = pickle.load(f)
+            if stored.get("version") != CATALOGUE_VERSION:
+                index = HeaderIndex(df)
+            else:
+                index = HeaderIndex(df, stored["headers"], stored["positions"], stored["cleaned"])
+            self._loaded[name] = index
+        return self._loaded[name]
+
+    def remove(self, name):
+        shutil.rmtree(self._path(name), ignore_errors=True)
+        self._loaded.pop(name, None)
+
+    # Loaded catalogues stay cached per store; workers reload their own
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_loaded"] = {}
+        return state
+
+
+def _write_frame(df, directory):
+    if feather is not None:
+        try:
+            # One record batch, so every column is one contiguous buffer _read_frame can map
+            feather.write_feather(df, os.path.join(directory, "items.feather"), compression="uncompressed",
+                                  chunksize=max(1, len(df)))
+            return "feather"
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            # Columns mixing text and numbers have no columnar type
+            print(f"Storing catalogue as pickle: {e}")
+    df.to_pickle(os.path.join(directory, "items.pkl"))
+    return "pickle"
+
+
+def _read_frame(directory, format):
+    if format == "pickle":
+        return pd.read_pickle(os.path.join(directory, "items.pkl"))
+    if feather is None:
+        raise ImportError("Reading this catalogue needs pyarrow: pip install pyarrow")
+    # Uncompressed Feather is memory-mapped, and split_blocks lets numeric
+    # columns without nulls stay views of the mapped file (read-only). String
+    # columns, and columns with nulls, are copied out.
+    table = feather.read_table(os.path.join(directory, "items.feather"), memory_map=True)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    # Arrow nulls come back as None; Excel-read sheets hold NaN
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+#   python catalogue.py import-sheet "SOR 1 (Vendor)" workbook.xlsx
+#   python catalogue.py import-pdf "SOR 2 (Vendor)" schedule.pdf
+#   python catalogue.py list
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage stored SOR catalogues")
+    parser.add_argument("--dir", help=f"catalogue directory (default: {DEFAULT_CATALOGUE_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sheet_command = commands.add_parser("import-sheet", help="store a workbook sheet")
+    sheet_command.add_argument("name", help="catalogue name, as used in HEADER COMPARISON")
+    sheet_command.add_argument("workbook")
+    sheet_command.add_argument("--sheet", help="sheet to import (default: the catalogue name)")
+    pdf_command = commands.add_parser("import-pdf", help="store the items extracted from a SOR PDF")
+    pdf_command.add_argument("name", help="catalogue name, as used in HEADER COMPARISON")
+    pdf_command.add_argument("pdf")
+    commands.add_parser("list", help="list stored catalogues")
+    remove_command = commands.add_parser("remove", help="delete a stored catalogue")
+    remove_command.add_argument("name")
+    args = parser.parse_args()
+
+    store = CatalogueStore(args.dir)
+    if args.command == "import-sheet":
+        print(store.import_sheet(args.name, args.workbook, args.sheet))
+    elif args.command == "import-pdf":
+        print(store.import_pdf(args.name, args.pdf))
+    elif args.command == "remove":
+        store.remove(args.name)
+    else:
+        for name in store.names():
+            meta = store.info(name)
+            print(f"{name}: {meta['rows']} rows, {meta['headers']} headers, imported {meta['imported']} from {meta['source']}")
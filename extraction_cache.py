@@ -0,0 +1,104 @@
+# extraction_cache.py
+
+import hashlib
+import os
+import pickle
+import time
+from sqlite_cache import SQLiteCache
+
+# Where the cache lives unless a directory is passed in
+DEFAULT_CACHE_DIR = os.environ.get("SOR_EXTRACT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sor-comparison"))
+
+
+# sha256 of a file's bytes, read in blocks. path can also be the bytes themselves.
+def file_hash(path, block_size=1 << 20):
+    if isinstance(path, (bytes, bytearray)):
+        return hashlib.sha256(path).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Page-level cache of PDF extraction results. Pages are keyed by the hash of
+# their content plus the extraction rules version, so a re-issued PDF only
+# re-extracts the pages that changed. Whole documents map their content hash
+# to their page keys. Least recently used pages are evicted past max_bytes.
+class ExtractionCache(SQLiteCache):
+    TABLES = ("pages", "documents")
+
+    def __init__(self, directory=None, max_bytes=1 << 30, filename="extraction.sqlite"):
+        super().__init__(directory or DEFAULT_CACHE_DIR, filename)
+        self.max_bytes = max_bytes
+        self.document_hits = 0
+
+    def _create(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " key TEXT PRIMARY KEY, lines BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, pages BLOB NOT NULL)")
+
+    def get_document(self, key):
+        row = self._connect().execute("SELECT pages FROM documents WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.document_hits += 1
+        return pickle.loads(row[0])
+
+    def put_document(self, key, page_keys):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO documents (key, pages) VALUES (?, ?)", (key, pickle.dumps(list(page_keys))))
+        conn.commit()
+
+    # Keys of the given page keys that are cached (no hit/miss counting)
+    def contains(self, keys):
+        return {row[0] for row in self._select_in("SELECT key FROM pages WHERE key IN ({marks})", dict.fromkeys(keys))}
+
+    # {key: lines} for the cached pages among keys.
+    # count=False for pages the caller has already counted as misses.
+    def get_pages(self, keys, count=True):
+        keys = list(dict.fromkeys(keys))
+        found = {key: pickle.loads(blob)
+                 for key, blob in self._select_in("SELECT key, lines FROM pages WHERE key IN ({marks})", keys)}
+        if found:
+            self._execute_in("UPDATE pages SET last_used = ? WHERE key IN ({marks})", found, [time.time()])
+            self._connect().commit()
+        if count:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get_page(self, key, count=True):
+        return self.get_pages([key], count).get(key)
+
+    # pages is {key: lines}
+    def put_pages(self, pages):
+        if not pages:
+            return
+        rows = []
+        for key, lines in pages.items():
+            blob = pickle.dumps(lines, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, len(blob), time.time()))
+        conn = self._connect()
+        conn.executemany("INSERT OR REPLACE INTO pages (key, lines, size, last_used) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        self._evict("pages", self.max_bytes, "size")
+
+    def put_page(self, key, lines):
+        self.put_pages({key: lines})
+
+    def stats(self):
+        conn = self._connect()
+        pages, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {
+            **super().stats(),
+            "document_hits": self.document_hits,
+            "pages": pages,
+            "documents": documents,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
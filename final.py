@@ -1,10 +1,18 @@
+import numpy as np
 import pandas as pd
 from fuzzywuzzy import fuzz, process
 import difflib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from datetime import datetime
+from matching import best_matches, ChoiceCorpus, SCORE_THRESHOLD
+from incremental import match_fingerprint, full_fingerprint
+from instrumentation import Instrumentation, stage
+from workbook import (OutputBuilder, open_workbook, check_fill_color, check_column_positions, check_flag_positions,
+                      check_highlight_mode, add_check_rules, widen, parse_size, SCORE_FLAG, PRICE_FLAG, TOO_MANY_FLAG)
 
 def common_prefix(strings):
     if not strings:
@@ -41,8 +49,61 @@ def clean_descriptions(terms):
     
     return cleaned_terms
 
-# Function to filter the a subset of a DataFrame based on a search string
+# Case-insensitive substring lookups on 'HEADER NAME', built once per sheet.
+# Rows are grouped by their distinct header text, so a lookup scans the few
+# distinct headers instead of every row, and repeated lookups are memoized.
+# cleaned can carry each header group's clean_description_column output
+# (as stored by catalogue.CatalogueStore), used when a lookup hits one group.
+class HeaderIndex:
+    def __init__(self, df, headers=None, positions=None, cleaned=None):
+        self.df = df
+        if headers is None:
+            groups = defaultdict(list)
+            if 'HEADER NAME' in df.columns:
+                for pos, value in enumerate(df['HEADER NAME']):
+                    if isinstance(value, str):
+                        # str.contains(case=False) compares upper-cased text
+                        groups[value.upper()].append(pos)
+            headers = list(groups)
+            positions = [np.array(rows, dtype=np.intp) for rows in groups.values()]
+        self.headers = headers
+        self.positions = positions
+        self.cleaned = cleaned
+        self._lookups = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    # Row positions whose header contains input_string, in sheet order
+    def lookup(self, input_string):
+        key = input_string.upper()
+        if key not in self._lookups:
+            hits = [rows for header, rows in zip(self.headers, self.positions) if key in header]
+            self._lookups[key] = np.sort(np.concatenate(hits)) if hits else np.empty(0, dtype=np.intp)
+        return self._lookups[key]
+
+    # Compact columns (see workbook.read_sheet) come back with their usual dtypes
+    def filter(self, input_string):
+        return widen(self.df.iloc[self.lookup(input_string)])
+
+    # Stored clean descriptions for input_string's rows, or None when they have to be computed
+    def clean(self, input_string):
+        if self.cleaned is None:
+            return None
+        key = input_string.upper()
+        hits = [k for k, header in enumerate(self.headers) if key in header]
+        if len(hits) != 1:
+            return None
+        return pd.Series(self.cleaned[hits[0]], index=self.df.index[self.positions[hits[0]]], dtype=object)
+
+# Function to filter the a subset of a DataFrame based on a search string.
+# df can also be a HeaderIndex built on the DataFrame to skip the full-column scan
 def filter_df(df, input_string):
+    if isinstance(df, HeaderIndex):
+        if 'HEADER NAME' not in df.df.columns:
+            print("The 'HEADER NAME' column was not found.")
+            return pd.DataFrame()
+        return df.filter(input_string)
     if 'HEADER NAME' not in df.columns:
         print("The 'HEADER NAME' column was not found.")
         return pd.DataFrame()
@@ -56,20 +117,8 @@ def find_closest_match(description, choices):
     match = process.extractOne(description, choices, scorer=fuzz.partial_ratio)
     return match
 
-def compare(acmv_df, d3_df, prefix):
-    # Add new columns to acmv_df to store the corresponding rates and descriptions
-    acmv_df = acmv_df[["HEADER NAME", "DESCRIPTION", "UNIT", "RATE"]].copy()
-    d3_df = d3_df.copy()
-    pdesc =f"{prefix}"
-    prate =f"{prefix} RATE"
-
-    acmv_df[pdesc] = None
-    acmv_df[prate] = None
-    acmv_df['Score'] = None
-    #acmv_df["Clean"] = None
-    print(acmv_df.shape[0])
-    print(d3_df.shape[0])
-
+# Clean Description for every d3 row: the common prefix of same-length descriptions removed
+def clean_description_column(d3_df):
     cleaned_terms = clean_descriptions(d3_df['DESCRIPTION'])
 
     # Create iterators for each word_count group
@@ -86,107 +135,139 @@ def compare(acmv_df, d3_df, prefix):
                     return description
         return description
 
+    return d3_df['DESCRIPTION'].apply(get_cleaned_description)
+
+# The d3 group's cleaned descriptions, normalized once for matching
+def choice_corpus(d3_df, clean=None):
+    if clean is None:
+        clean = clean_description_column(d3_df)
+    return ChoiceCorpus(clean.tolist())
+
+# Best d3 row position and its score for every acmv row (-1 where nothing matched).
+# corpus can be a choice_corpus built earlier for the same d3 group.
+def match_group(acmv_df, d3_df, backend=None, blocking=None, cache=None, clean=None, corpus=None):
+    if corpus is None:
+        corpus = choice_corpus(d3_df, clean)
+    acmv_descriptions = [str(description) for description in acmv_df['DESCRIPTION']]
+    best, best_scores = best_matches(acmv_descriptions, corpus, backend=backend, blocking=blocking, cache=cache)
+    found = best >= 0
+    best[found] = corpus.positions[best[found]]
+    return best, best_scores
+
+# matches can carry a match_group result from an earlier run to skip the scoring
+def compare(acmv_df, d3_df, prefix, backend=None, blocking=None, cache=None, matches=None, corpus=None):
+    # Add new columns to acmv_df to store the corresponding rates and descriptions
+    acmv_df = acmv_df[["HEADER NAME", "DESCRIPTION", "UNIT", "RATE"]].copy()
+    pdesc =f"{prefix}"
+    prate =f"{prefix} RATE"
 
-    d3_df['Clean Description'] = d3_df['DESCRIPTION'].apply(get_cleaned_description)
+    acmv_df[pdesc] = None
+    acmv_df[prate] = None
+    acmv_df['Score'] = None
+    #acmv_df["Clean"] = None
+    print(acmv_df.shape[0])
+    print(d3_df.shape[0])
 
     # List to keep track of the matched descriptions from d3_df
     matched_descriptions = []
 
-    # Iterate through each row of acmv.csv and find the best match from d3.csv
-    for index, row in acmv_df.iterrows():
-        acmv_description = str(row['DESCRIPTION'])
-        if pd.isna(acmv_description) or not str(acmv_description).strip():  # NaN or empty string after stripping
+    # Score every acmv description against every d3 description in one batch
+    acmv_descriptions = [str(description) for description in acmv_df['DESCRIPTION']]
+    if matches is None:
+        matches = match_group(acmv_df, d3_df, backend, blocking, cache, corpus=corpus)
+    best, best_scores = matches
+
+    descs = [None] * len(acmv_descriptions)
+    rates = [None] * len(acmv_descriptions)
+    match_scores = [None] * len(acmv_descriptions)
+    for i, acmv_description in enumerate(acmv_descriptions):
+        if not acmv_description.strip():  # empty string after stripping
             continue
-        d3_descriptions = d3_df['Clean Description'].tolist()
-        
-        # Get the closest match
-        match = find_closest_match(acmv_description, d3_descriptions)
-        if match == None:
+        j = best[i]
+        if j < 0:
             continue
-        # Get the corresponding rate from d3_df
+        # Get the corresponding rate and description from d3_df
+        descs[i] = d3_df['DESCRIPTION'].iat[j]
+        rates[i] = d3_df['RATE'].iat[j]
+        match_scores[i] = int(best_scores[i])
 
-        matching_row = d3_df[d3_df['Clean Description'] == match[0]]
-        
-        if not matching_row.empty:  # If there is a corresponding rate in d3_df
-            rate = matching_row['RATE'].values[0]
-            desc = matching_row['DESCRIPTION'].values[0]
-            # Update the 'D3 Description', 'D3 Rate', and 'Score' columns in acmv_df
-            acmv_df.at[index, pdesc] = desc
-            acmv_df.at[index, prate] = rate
-            acmv_df.at[index, 'Score'] = match[1]
-            #acmv_df.at[index, "Clean"] = match[0]
-            
-            # Append the matched description to the list
-            matched_descriptions.append(desc)
+        # Append the matched description to the list
+        matched_descriptions.append(descs[i])
 
-        #debug
-        #print(f"ACMV Description: {acmv_description}")
-        #print(f"Closest Match from d3.csv: {match[0]}")
-        #print(f"Match Score: {match[1]}")
-        #print(f"Corresponding d3.csv Rate: {rate if not matching_row.empty else 'N/A'}")
-        #print("-" * 80)  # Separator line for readability
+    # Update the 'D3 Description', 'D3 Rate', and 'Score' columns in acmv_df
+    acmv_df[pdesc] = pd.Series(descs, index=acmv_df.index, dtype=object)
+    acmv_df[prate] = pd.Series(rates, index=acmv_df.index, dtype=object)
+    acmv_df['Score'] = pd.Series(match_scores, index=acmv_df.index, dtype=object)
 
     # Create the copied_df by filtering d3_df for the matched descriptions
-    copied_d3 = d3_df[d3_df['DESCRIPTION'].isin(matched_descriptions)].copy()
+    copied_d3 = d3_df[d3_df['DESCRIPTION'].isin(matched_descriptions)]
     return acmv_df, copied_d3
 
 
+# 'Check' holds bit flags (SCORE_FLAG | PRICE_FLAG | TOO_MANY_FLAG); the text
+# ("Score, Price", ...) is produced from them when the workbook is written
 def check(updated_acmv_df, filtered_acmv, filtered_d3, copied_d3, prefix):
-    # Initialize 'Check' column as None (empty or NaN initially)
     pdesc =f"{prefix}"
     prate =f"{prefix} RATE"
     d3_not_in_acmv = pd.DataFrame()
     
     if not updated_acmv_df.empty:
         updated_acmv_df = updated_acmv_df.copy()
-        updated_acmv_df.loc[:, "Check"] = None  # Start with None (can be changed to empty string if needed)
 
         # Convert 'Score' to numeric, coercing errors to NaN
-        updated_acmv_df.loc[:, "Score"] = pd.to_numeric(updated_acmv_df["Score"], errors="coerce")
-        updated_acmv_df.loc[:, "RATE"] = pd.to_numeric(updated_acmv_df["RATE"], errors="coerce")
-        updated_acmv_df.loc[:, prate] = pd.to_numeric(updated_acmv_df[prate], errors="coerce")
+        score = pd.to_numeric(updated_acmv_df["Score"], errors="coerce")
+        rate = pd.to_numeric(updated_acmv_df["RATE"], errors="coerce")
+        matched_rate = pd.to_numeric(updated_acmv_df[prate], errors="coerce")
+        updated_acmv_df.loc[:, "Score"] = score
+        updated_acmv_df.loc[:, "RATE"] = rate
+        updated_acmv_df.loc[:, prate] = matched_rate
+        flags = np.zeros(len(updated_acmv_df), dtype=np.int8)
+
+        # Flag 'Score' where the match is weak
+        flags[(score <= SCORE_THRESHOLD).to_numpy()] |= SCORE_FLAG
         
-        # Append 'Score' check to 'Check' column where condition is met
-        updated_acmv_df.loc[updated_acmv_df["Score"] <= 60, "Check"] = updated_acmv_df.loc[updated_acmv_df["Score"] <= 60, "Check"].apply(lambda x: f"{x}, Score" if x and isinstance(x, str) else "Score")
-        
-        # Append 'Price Difference' check to 'Check' column where condition is met, but not if 'labour' is in 'DESCRIPTION'
-        updated_acmv_df.loc[
-            (abs(updated_acmv_df["RATE"] - updated_acmv_df[prate]) / updated_acmv_df["RATE"] > 0.50) &
-            (~updated_acmv_df[pdesc].str.contains("labour", case=False, na=False)), "Check"] = updated_acmv_df.loc[
-            (abs(updated_acmv_df["RATE"] - updated_acmv_df[prate]) / updated_acmv_df["RATE"] > 0.50) &
-            (~updated_acmv_df[pdesc].str.contains("labour", case=False, na=False)), "Check"].apply(
-            lambda x: f"{x}, Price" if x and isinstance(x, str) else "Price")
+        # Flag 'Price' where the rates differ by more than 50%, but not if 'labour' is in the matched description
+        price_diff = (abs(rate - matched_rate) / rate > 0.50) & (~updated_acmv_df[pdesc].str.contains("labour", case=False, na=False))
+        flags[price_diff.to_numpy(dtype=bool)] |= PRICE_FLAG
         
         # Case 1: acmv > d3 (if the difference in the number of rows is positive)
         diff = filtered_acmv.shape[0] - filtered_d3.shape[0]
         if diff > 0:
-            # Get the minimum value of the 'Score' column
-            min_score = updated_acmv_df["Score"].min()
-            # Append 'Too many ACMV' to 'Check' column where the score equals the minimum score
-
-            updated_acmv_df.loc[updated_acmv_df["Score"] == min_score, "Check"] = updated_acmv_df.loc[
-                updated_acmv_df["Score"] == min_score, "Check"].apply(lambda x: f"{x}, Too many ACMV" if x and isinstance(x, str) else "Too many ACMV")
-            updated_acmv_df.loc[updated_acmv_df["Score"] == min_score, [pdesc, prate]] = None
+            # Flag 'Too many ACMV' where the score equals the minimum score
+            lowest = score == score.min()
+            flags[lowest.to_numpy()] |= TOO_MANY_FLAG
+            updated_acmv_df.loc[lowest, [pdesc, prate]] = None
             
         elif diff < 0:
             d3_not_in_acmv = filtered_d3[~filtered_d3.index.isin(copied_d3.index)]
+        updated_acmv_df["Check"] = flags
     return updated_acmv_df, d3_not_in_acmv
 
 #reorder columns to kylee's standards dynamically
 def reorder(df):
+    reordered_df = df.iloc[:, reorder_positions(df.shape[1])]
+    return reordered_df
+
+# Column positions reorder picks from n_columns of side-by-side SOR blocks
+def reorder_positions(n_columns):
     constlist = [0, 1]
-    for i in range(4, df.shape[1], 8):
+    for i in range(4, n_columns, 8):
         constlist.append(i)
     
     constlist.append(2)
     
-    for j in range(df.shape[1]//8):
+    for j in range(n_columns//8):
         constlist.append(3 + 8 * j)
         for i in range(5, 8):
             constlist.append(i + 8 * j)
-
-    reordered_df = df.iloc[:, constlist]
-    return reordered_df
+    return constlist
+
+# The ACMV sheet from the per-SOR blocks: the columns reorder would pick from
+# their side-by-side concatenation, gathered straight into the final frame
+# in one concat instead of widening a frame per SOR and copying it again
+def assemble(finals):
+    columns = [final.iloc[:, k] for final in finals for k in range(final.shape[1])]
+    return pd.concat([columns[p] for p in reorder_positions(len(columns))], axis=1)
      
 #in the case of an error whereby there is no Description in "HEADER COMPARIOSN",
 def empty(acmv_df, prefix):
@@ -200,82 +281,272 @@ def empty(acmv_df, prefix):
     #acmv_df["Clean"] = None
     return acmv_df
 
-def main(input, output):
-    #output file
-    date = get_today_date()
-    #initialise excel sheet
-    hello = pd.DataFrame()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        hello.to_excel(writer, sheet_name='Sheet1', index=False)
+# compare + check for one header group. With an incremental store, the previous
+# run's result is reused when neither group changed, and only check is re-run
+# when the descriptions are unchanged but rates/units/other columns changed.
+# instrument (an instrumentation.Instrumentation) times matching separately from compare/check.
+# corpus is the d3 group's choice_corpus when the caller already has one.
+def compare_group(filtered_acmv, filtered_d3, prefix, backend=None, blocking=None, cache=None,
+                  previous=None, stats=None, instrument=None, corpus=None):
+    matches = None
+    outcome = "recomputed"
+    if previous is not None:
+        match_fp = match_fingerprint(filtered_acmv, filtered_d3, backend, blocking)
+        full_fp = full_fingerprint(filtered_acmv, filtered_d3)
+        if previous.get("full") == full_fp:
+            updated_acmv_df, d3_extras = previous["result"]
+            matches = previous["matches"]
+            outcome = "reused"
+        elif previous.get("match") == match_fp:
+            matches = previous["matches"]
+            outcome = "rechecked"
+
+    if outcome != "reused":
+        if matches is None and (previous is not None or instrument is not None):
+            with stage(instrument, "match", rows=len(filtered_acmv)) as event:
+                matches = match_group(filtered_acmv, filtered_d3, backend, blocking, cache, corpus=corpus)
+                event["matches"] = int((np.asarray(matches[0]) >= 0).sum())
+        with stage(instrument, "compare", rows=len(filtered_acmv)):
+            updated_acmv_df, copied_d3 = compare(filtered_acmv, filtered_d3, prefix, backend=backend, blocking=blocking,
+                                                 cache=cache, matches=matches, corpus=corpus)
+        with stage(instrument, "check", rows=len(updated_acmv_df)):
+            updated_acmv_df, d3_extras = check(updated_acmv_df, filtered_acmv, filtered_d3, copied_d3, prefix)
+    if previous is None:
+        return updated_acmv_df, d3_extras, None
+
+    if stats is not None:
+        stats[outcome] = stats.get(outcome, 0) + 1
+    state = {"match": match_fp, "full": full_fp, "matches": matches, "result": (updated_acmv_df, d3_extras)}
+    return updated_acmv_df, d3_extras, state
+
+# Compare every HEADER COMPARISON row for the SOR in column i+2 of ls.
+# Returns the "SOR n Additionals" frame and the SOR's block of ACMV columns.
+# acmv_df can be a HeaderIndex so it is indexed once for all SORs.
+# incremental (an incremental.IncrementalStore) reuses unchanged groups from the last run.
+# progress(sheet, group) is called after each header group.
+def compare_sor(acmv_df, ls, d3_df, i, backend=None, blocking=None, cache=None, incremental=None, instrument=None,
+                progress=None):
+    sheet = ls.columns[i+2].strip()
+    if instrument is not None:
+        instrument = instrument.scoped(sheet=sheet)
+    with stage(instrument, "sor", rows=len(d3_df)):
+        return _compare_sor(acmv_df, ls, d3_df, i, sheet, backend, blocking, cache, incremental, instrument, progress)
+
+def _compare_sor(acmv_df, ls, d3_df, i, sheet, backend, blocking, cache, incremental, instrument, progress):
+    if not isinstance(acmv_df, HeaderIndex):
+        acmv_df = HeaderIndex(acmv_df)
+    if not isinstance(d3_df, HeaderIndex):
+        d3_df = HeaderIndex(d3_df)
+    temp_acmv = []
+    temp_copied = []
+    previous_groups = incremental.load(sheet) if incremental is not None else None
+    groups = {}
+    stats = {}
+    # One normalized corpus per SOR header, shared by every ACMV header compared against it
+    corpora = {}
+    for index, row in ls.iterrows():
+        acmv_str = row.iloc[1]
+        d3_str = row.iloc[i+2]
+        print("acmv_str is", acmv_str)
+        print("d3_str is", d3_str)
+        prefix = ls.columns[i+2].strip()
+
+        #end of file
+        if pd.isna(d3_str) and pd.isna(acmv_str):
+            break
+        
+        #error check for d3_line empty
+        if pd.isna(d3_str):
+            filtered_acmv = filter_df(acmv_df, acmv_str)
+            updated_acmv_df = empty(filtered_acmv, prefix)
+            temp_acmv.append(updated_acmv_df)
+            if progress is not None:
+                progress(sheet, f"{acmv_str} -> {d3_str}")
+            continue
+
+        elif pd.isna(acmv_str):
+            print("HEADER COMPARISON ACMV VALUE MISSING")
+            if progress is not None:
+                progress(sheet, f"{acmv_str} -> {d3_str}")
+            continue
 
-    database = pd.DataFrame()
+        group_instrument = instrument.scoped(group=f"{acmv_str} -> {d3_str}") if instrument is not None else None
+        with stage(group_instrument, "filter_df") as event:
+            filtered_acmv = filter_df(acmv_df, acmv_str)
+            filtered_d3 = filter_df(d3_df, d3_str)
+            event["rows"] = len(filtered_acmv) + len(filtered_d3)
+        # Perform the matching between the filtered DataFrames
+        key = (index, acmv_str, d3_str)
+        previous = previous_groups.get(key, {}) if previous_groups is not None else None
+        corpus = None
+        if previous is None:
+            # Incremental runs build it only for the groups that need matching
+            if d3_str.upper() not in corpora:
+                corpora[d3_str.upper()] = choice_corpus(filtered_d3, d3_df.clean(d3_str))
+            corpus = corpora[d3_str.upper()]
+        updated_acmv_df, d3_extras, state = compare_group(filtered_acmv, filtered_d3, prefix, backend, blocking, cache,
+                                                          previous=previous, stats=stats, instrument=group_instrument,
+                                                          corpus=corpus)
+        if state is not None:
+            groups[key] = state
+        temp_copied.append(d3_extras)
+        temp_acmv.append(updated_acmv_df)
+        if progress is not None:
+            progress(sheet, f"{acmv_str} -> {d3_str}")
+
+    if incremental is not None:
+        incremental.save(sheet, groups)
+        print(f"{sheet}: {stats.get('reused', 0)} groups reused, {stats.get('rechecked', 0)} re-checked, "
+              f"{stats.get('recomputed', 0)} re-matched")
+        
+    #excess files for when d3>acmv
+    d3_additional = pd.concat(temp_copied, ignore_index=True)
+    d3_additional.columns = d3_additional.columns.str.upper()
+    headers = ["HEADER NAME", "DESCRIPTION","UNIT", "RATE"]
+    d3_additional = d3_additional[headers]
+    final = pd.concat(temp_acmv, ignore_index=True)
+    return d3_additional, final
+
+# input can be a path, a buffer, bytes or a WorkbookLoader shared with copy_sheet;
+# output can be a path, a buffer or an OutputBuilder that is written once all
+# stages have added to it.
+# workers > 1 compares the SORs in a process pool; results are gathered in
+# column order so the output matches a serial run.
+# cache (a match_cache.MatchCache) skips scoring for groups seen in earlier runs,
+# incremental (an incremental.IncrementalStore) only redoes header groups that changed,
+# instrument (an instrumentation.Instrumentation) records per-stage timings.
+# progress(event) gets {"done", "total", "sheet", "group"} after every header
+# group, or after every SOR sheet when the SORs run in a process pool.
+# catalogues (a catalogue.CatalogueStore) supplies SORs imported earlier: a
+# HEADER COMPARISON column naming a stored catalogue reads it from the store
+# instead of parsing the workbook sheet, which then does not need to exist.
+# pdfs maps HEADER COMPARISON SOR columns to SOR PDFs (paths, bytes or buffers,
+# or frames already extracted with pdf_sor); those SORs come straight from the
+# PDF, again without a workbook sheet. Names are matched after stripping, like
+# the HEADER COMPARISON columns themselves. pdf_options go to the extractor.
+# low_memory streams the base sheet in once, with categorical headers/units,
+# and keeps that frame for copy_sheet; memory_limit (bytes or "2GB", implies
+# low_memory) stops the run when it outgrows the limit. The output is then
+# written row by row (OutputBuilder's constant_memory).
+def main(input, output, backend=None, blocking=None, workers=None, cache=None, incremental=None, instrument=None,
+         progress=None, catalogues=None, pdfs=None, pdf_options=None, low_memory=False, memory_limit=None):
+    book = open_workbook(input)
+    if pdfs is not None:
+        pdfs = {str(name).strip(): source for name, source in pdfs.items()}
+    #output sheets are collected in memory and written once
+    low_memory = low_memory or memory_limit is not None
+    builder = output if isinstance(output, OutputBuilder) else OutputBuilder(constant_memory=low_memory)
 
     #BASE FILE (input)
-    acmv_df = pd.read_excel(input, sheet_name='INPUT 1 (ACMV)')
-    #HEADER COMPARISON
-    ls = pd.read_excel(input, sheet_name='HEADER COMPARISON')
-    
+    with stage(instrument, "load") as event:
+        if low_memory:
+            # Recorded first so a run stopped by the limit still reports it
+            memory = instrument.memory if instrument is not None else {}
+            memory["limit_bytes"] = parse_size(memory_limit)
+            # Every column: the comparison reads four, copy_sheet writes them all
+            acmv_df = book.compact_sheet('INPUT 1 (ACMV)', categories=["HEADER NAME", "UNIT"],
+                                         memory_limit=memory_limit)
+            memory["base_sheet_rows"] = len(acmv_df)
+            memory["base_sheet_bytes"] = int(acmv_df.memory_usage(deep=True).sum())
+            print(f"Base sheet: {len(acmv_df)} rows in {memory['base_sheet_bytes'] / 2**20:.1f} MB")
+        else:
+            acmv_df = book.sheet('INPUT 1 (ACMV)')
+        #HEADER COMPARISON
+        ls = book.sheet('HEADER COMPARISON')
+        event["rows"] = len(acmv_df) + len(ls)
+
+    sor_columns = []
     for i in range(ls.shape[1]-2):
-        temp_acmv = []
-        temp_copied = []
         if not "SOR" in ls.columns[i+2].upper():
             print("In this Header Comparison file, there are no 'SORS' ")
             continue
-        #copy sheets
-        d3_df = pd.read_excel(input, sheet_name=ls.columns[i+2].strip())
-        for index, row in ls.iterrows():
-            acmv_str = row.iloc[1]
-            d3_str = row.iloc[i+2]
-            print("acmv_str is", acmv_str)
-            print("d3_str is", d3_str)
-            prefix = ls.columns[i+2].strip()
-
-            #end of file
-            if pd.isna(d3_str) and pd.isna(acmv_str):
-                break
-            
-            #error check for d3_line empty
-            if pd.isna(d3_str):
-                filtered_acmv = filter_df(acmv_df, acmv_str)
-                updated_acmv_df = empty(filtered_acmv, prefix)
-                temp_acmv.append(updated_acmv_df)
-                continue
-
-            elif pd.isna(acmv_str):
-                print("HEADER COMPARISON ACMV VALUE MISSING")
-                continue
-
-            filtered_acmv = filter_df(acmv_df, acmv_str)
-            filtered_d3 = filter_df(d3_df, d3_str)
-            # Perform the matching between the filtered DataFrames
-            updated_acmv_df, copied_d3 = compare(filtered_acmv, filtered_d3, prefix)
-            updated_acmv_df, d3_extras = check(updated_acmv_df, filtered_acmv, filtered_d3, copied_d3, prefix)
-            temp_copied.append(d3_extras)
-            temp_acmv.append(updated_acmv_df)
-            
-        #excess files for when d3>acmv
-        d3_additional = pd.concat(temp_copied, ignore_index=True)
-        d3_additional.columns = d3_additional.columns.str.upper()
-        headers = ["HEADER NAME", "DESCRIPTION","UNIT", "RATE"]
-        d3_additional = d3_additional[headers]
-        with pd.ExcelWriter(output, engine='openpyxl', mode='a') as writer:
-            d3_additional.to_excel(writer, sheet_name=f"SOR {i+1} Additionals", index=False)
-        final = pd.concat(temp_acmv, ignore_index=True)
-        #concat db if not first
-        if i == 0:
-            database = final
-        else: 
-            database = pd.concat([database, final],axis=1)
-    
-    with pd.ExcelWriter(output, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-        database = reorder(database)
-        # Remove columns with names that start with 'Unnamed:'
-        database.to_excel(writer, sheet_name="ACMV", index=False)
+        sor_columns.append(i)
+
+    #copy sheets
+    d3_dfs = []
+    for i in sor_columns:
+        sheet = ls.columns[i+2].strip()
+        with stage(instrument.scoped(sheet=sheet) if instrument is not None else None, "load") as event:
+            if pdfs is not None and sheet in pdfs:
+                d3_dfs.append(pdf_sor(pdfs[sheet], pdf_options))
+            elif catalogues is not None and sheet in catalogues:
+                d3_dfs.append(catalogues.header_index(sheet))
+            else:
+                d3_dfs.append(book.sheet(sheet))
+            event["rows"] = len(d3_dfs[-1])
+    if book is not input:
+        book.close()
+    with stage(instrument, "header_index", rows=len(acmv_df)):
+        acmv_index = HeaderIndex(acmv_df)
+    options = dict(backend=backend, blocking=blocking, cache=cache, incremental=incremental)
+    group_counts = {i: count_groups(ls, i) for i in sor_columns}
+    done = 0
+    def advance(sheet, group, count=1):
+        nonlocal done
+        done += count
+        progress({"done": done, "total": sum(group_counts.values()), "sheet": sheet, "group": group})
+
+    if workers and workers > 1 and len(sor_columns) > 1:
+        # Workers time into their own Instrumentation; the events are merged back here
+        task = partial(_timed_compare_sor if instrument is not None else compare_sor, acmv_index, ls, **options)
+        results = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(sor_columns))) as executor:
+            for i, result in zip(sor_columns, executor.map(task, d3_dfs, sor_columns)):
+                if instrument is not None:
+                    result, events = result
+                    instrument.merge(events)
+                results.append(result)
+                if progress is not None:
+                    advance(ls.columns[i+2].strip(), None, group_counts[i])
+    else:
+        results = map(partial(compare_sor, acmv_index, ls, instrument=instrument,
+                              progress=advance if progress is not None else None, **options), d3_dfs, sor_columns)
+
+    finals = []
+    for i, (d3_additional, final) in zip(sor_columns, results):
+        builder.add_sheet(f"SOR {i+1} Additionals", d3_additional)
+        finals.append(final)
+
+    with stage(instrument, "assemble", rows=sum(len(final) for final in finals)):
+        database = assemble(finals)
+    builder.add_sheet("ACMV", database, if_sheet_exists='replace',
+                      flag_columns=check_flag_positions(database.columns))
+    if builder is not output:
+        with stage(instrument, "write", rows=sum(len(df) for df in builder.sheets.values())):
+            builder.write(output, engine='openpyxl')
+
+# SOR frame for a PDF source; frames that were extracted already pass through
+def pdf_sor(source, options=None):
+    if isinstance(source, pd.DataFrame):
+        return source
+    import sor_converter  # needs PyMuPDF
+    return sor_converter.extract_sor(source, **(options or {}))
+
+# Number of HEADER COMPARISON rows compare_sor goes through for the SOR in column i+2
+def count_groups(ls, i):
+    for count, (acmv_str, d3_str) in enumerate(zip(ls.iloc[:, 1], ls.iloc[:, i+2])):
+        if pd.isna(d3_str) and pd.isna(acmv_str):
+            return count
+    return len(ls)
+
+def _timed_compare_sor(acmv_df, ls, d3_df, i, **options):
+    instrument = Instrumentation()
+    result = compare_sor(acmv_df, ls, d3_df, i, instrument=instrument, **options)
+    return result, instrument.events
 
 
                 
-def color_check_cells(file_path="output.xlsx"):
-
+# file_path can be a saved workbook (path or buffer) or an OutputBuilder; a builder only
+# records the sheet order and which columns to highlight, fills are applied when it is written.
+# mode "cells" fills each flagged cell, "rules" adds conditional formatting rules instead.
+def color_check_cells(file_path="output.xlsx", instrument=None, mode="cells"):
+    check_highlight_mode(mode)
+    with stage(instrument, "color_check_cells"):
+        if isinstance(file_path, OutputBuilder):
+            return _color_check_builder(file_path, mode)
+        return _color_check_file(file_path, mode)
+
+def _color_check_file(file_path, mode="cells"):
     wb = load_workbook(file_path)
 
     if 'Sheet1' in wb.sheetnames:
@@ -293,46 +564,56 @@ def color_check_cells(file_path="output.xlsx"):
         return
     ws = wb["ACMV"]
     # Identify all columns with headers containing "Check" (case-insensitive)
-    check_columns = []
-    for cell in ws[1]:
-        if cell.value and "check" in str(cell.value).lower():
-            check_columns.append(cell.column)
+    check_columns = [pos + 1 for pos in check_column_positions([cell.value for cell in ws[1]])]
     
     if not check_columns:
         print("No Check columns found in ACMV sheet")
         return
 
+    if mode == "rules":
+        add_check_rules(ws, [col - 1 for col in check_columns], ws.max_row - 1)
+    else:
+        _fill_check_cells(ws, check_columns)
+
+    if hasattr(file_path, "seek"):
+        # Rewrite the buffer in place rather than appending a second workbook to it
+        file_path.seek(0)
+        file_path.truncate()
+    wb.save(file_path)
+
+# Static fill on every flagged Check cell (1-based check_columns)
+def _fill_check_cells(ws, check_columns):
     # Define fill styles
-    purple_fill = PatternFill("solid", fgColor="d6b6d6")  # For Score diff only
-    blue_fill = PatternFill("solid", fgColor="b6c9d6")      # For Price diff only
-    yellow_fill = PatternFill("solid", fgColor="f7f7be")    # For both Score and Price diffs
-    remove_fill = PatternFill("solid", fgColor="92d050")              # To green fill
+    fills = {}
     
     # Iterate over rows (starting from row 2, assuming row 1 is the header)
     for row in range(2, ws.max_row + 1):
         for col in check_columns:
             check_cell = ws.cell(row=row, column=col)
             if check_cell.value is not None:
-                text = str(check_cell.value).lower()
-                
-                # If "Too many ACMV" is present, remove fill
-                if "too many acmv" in text:
-                    fill = remove_fill
-                else:
-                    has_score = "score" in text
-                    has_price = "price" in text
-                    if has_score and has_price:
-                        fill = yellow_fill
-                    elif has_score:
-                        fill = purple_fill
-                    elif has_price:
-                        fill = blue_fill
+                color = check_fill_color(check_cell.value)
+                if color is None:
+                    continue
+                if color not in fills:
+                    fills[color] = PatternFill("solid", fgColor=color)
 
                 # Apply the fill to the check cell and the three cells immediately to its left (if available)
                 for c in range(max(1, col - 3), col + 1):
-                    ws.cell(row=row, column=c).fill = fill
-                        
-    wb.save(file_path)
+                    ws.cell(row=row, column=c).fill = fills[color]
+
+def _color_check_builder(builder, mode="cells"):
+    builder.remove_sheet('Sheet1')
+    # Reordering sheets
+    builder.move_to_front(builder.sheet_names[-1])
+
+    if "ACMV" not in builder.sheet_names:
+        print("ACMV sheet not found in workbook")
+        return
+    check_columns = check_column_positions(builder.sheets["ACMV"].columns)
+    if not check_columns:
+        print("No Check columns found in ACMV sheet")
+        return
+    builder.highlight_checks("ACMV", check_columns, mode)
 
 
 
@@ -341,21 +622,58 @@ def get_today_date():
     return datetime.today().strftime('%d_%b_%y')
 date = get_today_date()
 
-def copy_sheet(input, output):
-    all_sheets = pd.read_excel(input, sheet_name=None)  # Returns a dict: {sheet_name: DataFrame}
+# compact streams the sheets main did not read (see WorkbookLoader.sheets)
+def copy_sheet(input, output, instrument=None, compact=False, memory_limit=None):
+    with stage(instrument, "copy_sheet"):
+        _copy_sheet(input, output, compact, memory_limit)
+
+def _copy_sheet(input, output, compact=False, memory_limit=None):
+    book = open_workbook(input)
+    all_sheets = book.sheets(compact, memory_limit)  # Returns a dict: {sheet_name: DataFrame}
+    if book is not input:
+        book.close()
     def remove_unnamed(df):
-        return df.loc[:, ~df.columns.str.contains('^Unnamed', regex=True)]
+        named = ~df.columns.str.contains('^Unnamed', regex=True)
+        # Selecting columns copies the frame; most sheets have nothing to drop
+        return df if named.all() else df.loc[:, named]
+    if isinstance(output, OutputBuilder):
+        for sheet_name, df in all_sheets.items():
+            output.add_sheet(sheet_name, remove_unnamed(df), if_sheet_exists='new')
+        return
     # Try to open existing destination workbook
     with pd.ExcelWriter(output, engine='openpyxl', mode='a', if_sheet_exists='new') as writer:
         for sheet_name, df in all_sheets.items():
             cleaned = remove_unnamed(df)
             cleaned.to_excel(writer, sheet_name=sheet_name, index=False)
 
+# main, color_check_cells and copy_sheet on one parsed input and one OutputBuilder.
+# input is a path, buffer or bytes; the output workbook is returned as bytes, or
+# written to output (a path or buffer) when given. Other keywords go to main.
+# SORs read from pdfs are added as sheets after the input's own sheets.
+# highlight is color_check_cells' mode.
+def compare_workbook(input, output=None, instrument=None, engine=None, pdfs=None, highlight="cells", **options):
+    low_memory = options.get("low_memory") or options.get("memory_limit") is not None
+    builder = OutputBuilder(constant_memory=low_memory)
+    if pdfs:
+        with stage(instrument, "extract_pdf") as event:
+            pdfs = {str(name).strip(): pdf_sor(source, options.get("pdf_options")) for name, source in pdfs.items()}
+            event["rows"] = sum(len(df) for df in pdfs.values())
+    with open_workbook(input) as book:
+        main(book, builder, instrument=instrument, pdfs=pdfs, **options)
+        color_check_cells(builder, instrument=instrument, mode=highlight)
+        copy_sheet(book, builder, instrument=instrument, compact=low_memory, memory_limit=options.get("memory_limit"))
+    for name, df in (pdfs or {}).items():
+        if name not in builder.sheet_names:
+            builder.add_sheet(name, df)
+    with stage(instrument, "write"):
+        if output is None:
+            return builder.to_bytes(engine)
+        builder.write(output, engine)
+
 # Run the main process and then color cells as needed
 if __name__ == "__main__":
-    input = 'acmv_final.xlsx'
     output = f"ACMV_{get_today_date()}.xlsx"
-    main(input, output)
-    color_check_cells(output)
-    copy_sheet(input, output)
+    instrument = Instrumentation()
+    compare_workbook('acmv_final.xlsx', output, instrument=instrument)
+    print("Timings written to", instrument.write_report(output))
 
@@ -0,0 +1,68 @@
+# incremental.py
+
+import hashlib
+import os
+import pickle
+import pandas as pd
+
+# Bump when the stored group state changes shape
+STATE_VERSION = 2
+
+
+# Stable hash of the given columns of one or more DataFrames, index included
+def fingerprint(frames, columns=None, extra=()):
+    digest = hashlib.sha1()
+    for df in frames:
+        part = df if columns is None else df[[c for c in columns if c in df.columns]]
+        digest.update(repr(list(part.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+    for item in extra:
+        digest.update(repr(item).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Fingerprint of what the matching depends on: which rows there are and their descriptions
+def match_fingerprint(filtered_acmv, filtered_d3, backend=None, blocking=None):
+    return fingerprint([filtered_acmv, filtered_d3], ["DESCRIPTION"], (STATE_VERSION, backend, blocking))
+
+
+# Fingerprint of everything compare + check read from the two groups
+def full_fingerprint(filtered_acmv, filtered_d3):
+    return fingerprint([filtered_acmv, filtered_d3], None, (STATE_VERSION,))
+
+
+# Keeps the previous run's per-group fingerprints and compare/check results,
+# one pickle per SOR sheet so process-pool workers never share a file.
+# Group state is {(row, acmv_str, d3_str): {"match": ..., "full": ..., "matches": ..., "result": ...}}
+class IncrementalStore:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, sheet):
+        name = hashlib.sha1(sheet.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def load(self, sheet):
+        try:
+            with open(self._path(sheet), "rb") as f:
+                stored = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return {}
+        if stored.get("version") != STATE_VERSION or stored.get("sheet") != sheet:
+            return {}
+        return stored["groups"]
+
+    # Replaces the sheet's state, so groups that disappeared are dropped
+    def save(self, sheet, groups):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(sheet)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"version": STATE_VERSION, "sheet": sheet, "groups": groups}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,123 @@
+# instrumentation.py
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Per-stage timings of a comparison run. Every timed block becomes an event
+# {"stage", "seconds", "rows", "matches"} plus the sheet/group labels of the
+# scope it was recorded in. report() sums the events per stage, per SOR sheet
+# and per header group. callback(event) is called as each event is recorded,
+# including events merged back from worker processes. memory collects figures
+# such as the low-memory reader's limit and base sheet size for the report.
+class Instrumentation:
+    def __init__(self, callback=None, labels=None, events=None):
+        self.callback = callback
+        self.labels = labels or {}
+        self.events = [] if events is None else events
+        self.memory = {}
+        self.started = time.perf_counter()
+
+    # Shares this run's events; everything recorded through it carries the extra labels
+    def scoped(self, **labels):
+        child = Instrumentation(self.callback, {**self.labels, **labels}, self.events)
+        child.memory = self.memory
+        child.started = self.started
+        return child
+
+    # Times the block. The yielded event can be updated with rows/matches found inside it.
+    @contextmanager
+    def stage(self, name, rows=0, matches=0):
+        event = {"stage": name, "seconds": 0.0, "rows": rows, "matches": matches, **self.labels}
+        start = time.perf_counter()
+        try:
+            yield event
+        finally:
+            event["seconds"] = time.perf_counter() - start
+            self._add(event)
+
+    def _add(self, event):
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    # Events recorded elsewhere, e.g. by a worker process
+    def merge(self, events):
+        for event in events:
+            self._add(dict(event))
+
+    # Stages nest (a sheet's "sor" stage contains its groups' "match" stages),
+    # so stage seconds do not add up to wall_seconds
+    def report(self):
+        sheets = {}
+        groups = {}
+        for event in self.events:
+            if "sheet" in event:
+                sheets.setdefault(event["sheet"], []).append(event)
+                if "group" in event:
+                    groups.setdefault((event["sheet"], event["group"]), []).append(event)
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "stages": _totals(self.events),
+            "sheets": {sheet: _totals(events) for sheet, events in sheets.items()},
+            "groups": [{"sheet": sheet, "group": group, "stages": _totals(events)}
+                       for (sheet, group), events in groups.items()],
+            "memory": {"peak_rss_bytes": peak_rss(), **self.memory},
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+    # Writes the report next to an output workbook: ACMV_01_Jan_25.xlsx -> ACMV_01_Jan_25.timings.json
+    def write_report(self, output):
+        return self.write(report_path(output))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["callback"] = None
+        return state
+
+
+# Peak resident memory of this process so far, or None where it cannot be read
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+def report_path(output):
+    return f"{os.path.splitext(str(output))[0]}.timings.json"
+
+
+# Calls, seconds, rows and matches per stage, with throughput
+def _totals(events):
+    totals = {}
+    for event in events:
+        entry = totals.setdefault(event["stage"], {"calls": 0, "seconds": 0.0, "rows": 0, "matches": 0})
+        entry["calls"] += 1
+        entry["seconds"] += event["seconds"]
+        entry["rows"] += event["rows"]
+        entry["matches"] += event["matches"]
+    for entry in totals.values():
+        seconds = entry["seconds"]
+        entry["rows_per_second"] = entry["rows"] / seconds if seconds else None
+        entry["matches_per_second"] = entry["matches"] / seconds if seconds and entry["matches"] else None
+    return totals
+
+
+# instrument.stage(...), or a no-op when there is no instrument
+def stage(instrument, name, rows=0, matches=0):
+    if instrument is None:
+        return nullcontext({})
+    return instrument.stage(name, rows, matches)
@@ -0,0 +1,329 @@
+# jobs.py
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import Manager
+from final import compare_workbook
+from instrumentation import Instrumentation
+
+# Where finished comparisons are kept unless a directory is passed in
+DEFAULT_RESULT_DIR = os.environ.get(
+    "SOR_RESULT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sor-comparison", "results"))
+
+# SOR_LOW_MEMORY=1 reads uploads with the low-memory base sheet reader, and
+# SOR_MEMORY_LIMIT (e.g. 2GB) fails a job whose base sheet outgrows it
+# instead of letting the container run out of memory
+LOW_MEMORY = os.environ.get("SOR_LOW_MEMORY", "") not in ("", "0")
+MEMORY_LIMIT = os.environ.get("SOR_MEMORY_LIMIT") or None
+
+# SOR_HIGHLIGHT=rules writes the Check highlighting as conditional formatting
+HIGHLIGHT = os.environ.get("SOR_HIGHLIGHT", "cells")
+
+
+# Jobs are keyed by the sha256 of the uploaded workbook, and of any SOR PDFs
+# with the SOR column each one is read for, plus the highlight mode unless it is "cells"
+def upload_key(data, pdfs=None):
+    digest = hashlib.sha256(data)
+    if HIGHLIGHT != "cells":
+        digest.update(f"\0highlight={HIGHLIGHT}".encode("utf-8"))
+    for name in sorted(pdfs or {}):
+        digest.update(f"\0{name}\0{hashlib.sha256(pdfs[name]).hexdigest()}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Full comparison of an uploaded workbook in memory. Returns the output workbook as bytes.
+# pdfs maps HEADER COMPARISON SOR columns to uploaded PDF bytes.
+def run_comparison(data, progress=None, instrument=None, pdfs=None):
+    return compare_workbook(data, instrument=instrument, progress=progress, pdfs=pdfs,
+                            low_memory=LOW_MEMORY, memory_limit=MEMORY_LIMIT, highlight=HIGHLIGHT)
+
+
+# Runs in a pool process; progress goes to a Manager dict shared with the app.
+# The key is entered as soon as a worker picks the job up, so after a worker
+# dies the jobs that had started can be told from those still queued.
+# quiet drops the pipeline's per-group prints.
+def _run_job(key, data, progress_table, pdfs=None, quiet=False):
+    def progress(event):
+        progress_table[key] = event
+    progress_table[key] = None
+    instrument = Instrumentation()
+    if quiet:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            output = run_comparison(data, progress, instrument, pdfs)
+    else:
+        output = run_comparison(data, progress, instrument, pdfs)
+    return output, instrument.report()
+
+
+# Finished outputs and their timing reports on disk, newest max_entries kept
+class ResultCache:
+    def __init__(self, directory=None, max_entries=50):
+        self.directory = directory or DEFAULT_RESULT_DIR
+        self.max_entries = max_entries
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    # (output bytes, report) or None
+    def get(self, key):
+        try:
+            with open(self._path(key, ".xlsx"), "rb") as f:
+                output = f.read()
+            with open(self._path(key, ".timings.json")) as f:
+                report = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(self._path(key, ".xlsx"))
+        return output, report
+
+    def put(self, key, output, report):
+        os.makedirs(self.directory, exist_ok=True)
+        # The report goes last: a result only counts once both files are in place
+        for suffix, content, mode in ((".xlsx", output, "wb"), (".timings.json", json.dumps(report), "w")):
+            path = self._path(key, suffix)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(content)
+            os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        outputs = [name for name in os.listdir(self.directory) if name.endswith(".xlsx")]
+        if len(outputs) <= self.max_entries:
+            return
+        outputs.sort(key=lambda name: os.path.getmtime(os.path.join(self.directory, name)))
+        for name in outputs[:len(outputs) - self.max_entries]:
+            key = name[:-len(".xlsx")]
+            for suffix in (".xlsx", ".timings.json"):
+                try:
+                    os.remove(self._path(key, suffix))
+                except FileNotFoundError:
+                    pass
+
+
+# JobManager.submit when max_queued jobs are already waiting for a worker
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, future=None, result=None, progress_table=None):
+        self.key = key
+        self.future = future
+        self._result = result
+        self._progress_table = progress_table
+        self.submitted = time.time()
+        self.finished = None if future is not None else self.submitted
+        # Set by JobManager while the job runs: the executor it was last sent
+        # to, the upload (kept to resubmit it after a crash) and the crashes so far
+        self.executor = None
+        self.upload = None
+        self.crashes = 0
+
+    @property
+    def done(self):
+        return self.future is None or self.future.done()
+
+    @property
+    def failed(self):
+        return self.future is not None and self.future.done() and self.future.exception() is not None
+
+    @property
+    def status(self):
+        if self.future is None:
+            return "cached"
+        if self.future.running():
+            return "running"
+        if not self.future.done():
+            return "queued"
+        return "failed" if self.failed else "done"
+
+    # Latest progress event from main ({"done", "total", "sheet", "group"}), or None
+    def progress(self):
+        if self.done:
+            return None
+        return self._progress_table.get(self.key)
+
+    # (output bytes, report); raises the job's exception if it failed
+    def result(self, timeout=None):
+        if self._result is None:
+            self._result = self.future.result(timeout)
+        return self._result
+
+
+# Runs comparisons in a bounded process pool shared by every app session.
+# Submitting a workbook that is already running or finished returns that job
+# instead of starting another, and finished results survive restarts in a ResultCache.
+# With max_queued, submit raises QueueFull once that many jobs are waiting
+# for a worker; None queues without limit. quiet silences the workers' output.
+# A worker that dies (e.g. killed for running out of memory) breaks the whole
+# pool; the pool is then replaced and only the job that crashed fails (see _recover).
+# Jobs that had not started yet are resubmitted.
+class JobManager:
+    def __init__(self, max_workers=None, result_dir=None, keep_jobs=32, max_queued=None, quiet=False):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_queued = max_queued
+        self.quiet = quiet
+        self.results = ResultCache(result_dir)
+        self.keep_jobs = keep_jobs
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._isolated = None
+        self._manager = Manager()
+        self._progress = self._manager.dict()
+        self._jobs = {}
+        # Re-entrant: a future that is already done runs _finished inside submit
+        self._lock = threading.RLock()
+        self.started = time.time()
+        self._counts = {"submitted": 0, "deduplicated": 0, "cached": 0, "rejected": 0, "completed": 0, "failed": 0}
+        # (finished at, seconds from submit to finish, seconds running) of recent jobs
+        self._recent = deque(maxlen=1000)
+
+    def submit(self, data, pdfs=None):
+        key = upload_key(data, pdfs)
+        with self._lock:
+            self._counts["submitted"] += 1
+            job = self._jobs.get(key)
+            if job is not None and not job.failed:
+                self._counts["deduplicated"] += 1
+                return job
+            cached = self.results.get(key)
+            if cached is not None:
+                self._counts["cached"] += 1
+                job = Job(key, result=cached)
+            else:
+                if self.max_queued is not None and self._pending() >= self.max_workers + self.max_queued:
+                    self._counts["rejected"] += 1
+                    raise QueueFull(f"{self.max_queued} jobs are already waiting for a worker")
+                job = Job(key, progress_table=self._progress)
+                job.upload = (data, pdfs)
+                self._start(job)
+            self._jobs[key] = job
+            self._prune()
+        return job
+
+    # A job submitted earlier, or a finished result kept in the ResultCache
+    def get(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None:
+            cached = self.results.get(key)
+            if cached is not None:
+                job = Job(key, result=cached)
+        return job
+
+    def _pending(self):
+        return sum(not job.done for job in self._jobs.values())
+
+    # Send job to the shared executor (or the one-worker executor that retries
+    # jobs after a crash), replacing it first if it is already broken
+    def _start(self, job, isolated=False):
+        data, pdfs = job.upload
+        self._progress.pop(job.key, None)
+        if isolated and self._isolated is None:
+            self._isolated = ProcessPoolExecutor(max_workers=1)
+        executor = self._isolated if isolated else self._executor
+        try:
+            future = executor.submit(_run_job, job.key, data, self._progress, pdfs, self.quiet)
+        except BrokenProcessPool:
+            self._recover(executor)
+            executor = self._isolated if isolated else self._executor
+            future = executor.submit(_run_job, job.key, data, self._progress, pdfs, self.quiet)
+        job.executor = executor
+        job.future = future
+        job.finished = None
+        future.add_done_callback(lambda future: self._finished(job, future, executor))
+
+    # Replace a broken executor once, and decide what happens to the jobs it
+    # held. Jobs a worker had not picked up are resubmitted. If one job had
+    # started, it is the one that crashed and fails. If several had, each is
+    # retried on its own in a one-worker executor, so a crash there fails
+    # only the job that caused it.
+    def _recover(self, executor):
+        with self._lock:
+            isolated = executor is self._isolated
+            if executor is self._executor:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            elif isolated:
+                self._isolated = ProcessPoolExecutor(max_workers=1)
+            else:
+                return
+            affected = [job for job in self._jobs.values() if job.executor is executor and job.upload is not None]
+            started = [job for job in affected if job.key in self._progress] or affected
+            for job in affected:
+                if job not in started:
+                    self._start(job, isolated)
+                elif len(started) > 1 and not job.crashes:
+                    job.crashes += 1
+                    self._start(job, isolated=True)
+
+    def _finished(self, job, future, executor):
+        if isinstance(future.exception(), BrokenProcessPool):
+            self._recover(executor)
+            with self._lock:
+                if job.future is not future:  # resubmitted to the new pool
+                    return
+        job.upload = None
+        job.finished = time.time()
+        self._progress.pop(job.key, None)
+        failed = future.exception() is not None
+        running = None
+        if not failed:
+            output, report = future.result()
+            self.results.put(job.key, output, report)
+            running = report["wall_seconds"]
+        with self._lock:
+            self._counts["failed" if failed else "completed"] += 1
+            self._recent.append((job.finished, job.finished - job.submitted, running))
+
+    # Queue depth, counters, latency (submit to finish) and throughput of the last minute / hour
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            jobs = list(self._jobs.values())
+            counts = dict(self._counts)
+            recent = list(self._recent)
+        running = sum(job.status == "running" for job in jobs)
+        return {
+            "uptime_seconds": now - self.started,
+            "workers": self.max_workers,
+            "max_queued": self.max_queued,
+            "running": running,
+            "queued": sum(not job.done for job in jobs) - running,
+            **counts,
+            "latency_seconds": _summary([latency for _, latency, _ in recent]),
+            "run_seconds": _summary([seconds for _, _, seconds in recent if seconds is not None]),
+            "throughput_per_minute": {
+                "last_minute": sum(finished > now - 60 for finished, _, _ in recent),
+                "last_hour": sum(finished > now - 3600 for finished, _, _ in recent) / 60,
+            },
+        }
+
+    # Forget the oldest finished jobs; their results stay in the ResultCache
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+            del self._jobs[key]
+
+    def shutdown(self):
+        self._executor.shutdown()
+        if self._isolated is not None:
+            self._isolated.shutdown()
+        self._manager.shutdown()
+
+
+# count / mean / p50 / p95 / max of a list of durations
+def _summary(values):
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    values = sorted(values)
+    def percentile(p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+    return {"count": len(values), "mean": sum(values) / len(values), "p50": percentile(0.5),
+            "p95": percentile(0.95), "max": values[-1]}
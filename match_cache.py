@@ -0,0 +1,84 @@
+# match_cache.py
+
+import hashlib
+import os
+import time
+from fuzzywuzzy import utils
+from sqlite_cache import SQLiteCache
+
+# Where the cache lives unless a directory is passed in
+DEFAULT_CACHE_DIR = os.environ.get("SOR_MATCH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sor-comparison"))
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# Persistent best-match cache shared across runs. Entries are keyed by the
+# SOR group (its cleaned descriptions plus the matching options) and the
+# normalized ACMV description, and hold the best row's index, text and score.
+# The least recently used entries are dropped once max_entries is exceeded.
+class MatchCache(SQLiteCache):
+    TABLES = ("matches",)
+
+    def __init__(self, directory=None, max_entries=200_000, filename="matches.sqlite"):
+        super().__init__(directory or DEFAULT_CACHE_DIR, filename)
+        self.max_entries = max_entries
+
+    def _create(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            " grp TEXT NOT NULL, query TEXT NOT NULL, idx INTEGER NOT NULL,"
+            " match TEXT, score INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (grp, query))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used)")
+
+    # Hash of everything besides the query that decides the result
+    @staticmethod
+    def group_key(choices, backend=None, blocking=None):
+        parts = [str(backend), repr(blocking)]
+        parts += [c if isinstance(c, str) else f"<{c!r}>" for c in choices]
+        return _sha1("\x1f".join(parts))
+
+    @staticmethod
+    def query_key(query):
+        return _sha1(utils.full_process(query))
+
+    # query_key of a query that is already full_process'ed
+    @staticmethod
+    def processed_query_key(processed):
+        return _sha1(processed)
+
+    # {query_key: (idx, match, score)} for the keys found in the cache
+    def get_many(self, group, query_keys):
+        query_keys = list(dict.fromkeys(query_keys))
+        rows = self._select_in("SELECT query, idx, match, score FROM matches WHERE grp = ? AND query IN ({marks})",
+                               query_keys, [group])
+        found = {query: (idx, match, score) for query, idx, match, score in rows}
+        if found:
+            self._execute_in("UPDATE matches SET last_used = ? WHERE grp = ? AND query IN ({marks})",
+                             found, [time.time(), group])
+            self._connect().commit()
+        self.hits += len(found)
+        self.misses += len(query_keys) - len(found)
+        return found
+
+    # entries is {query_key: (idx, match, score)}
+    def put_many(self, group, entries):
+        if not entries:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO matches (grp, query, idx, match, score, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            [(group, key, int(idx), match, int(score), now) for key, (idx, match, score) in entries.items()],
+        )
+        conn.commit()
+        self._evict("matches", self.max_entries)
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def stats(self):
+        return {**super().stats(), "entries": len(self), "max_entries": self.max_entries}
@@ -0,0 +1,320 @@
+# matching.py
+
+import math
+import numpy as np
+from collections import defaultdict
+from dataclasses import dataclass
+from fuzzywuzzy import fuzz, utils
+
+try:
+    from rapidfuzz import fuzz as rf_fuzz, process as rf_process, utils as rf_utils
+except ImportError:  # rapidfuzz is optional, fuzzywuzzy is always available
+    rf_process = None
+
+# Backend used when compare() is not told otherwise. fuzzywuzzy gives the exact
+# scores process.extractOne(..., scorer=fuzz.partial_ratio) has always produced.
+DEFAULT_BACKEND = "fuzzywuzzy"
+
+# Matches scoring at or below this are flagged "Score" by final.check
+SCORE_THRESHOLD = 60
+
+# Score given to choices that cannot be scored (NaN / non-string descriptions)
+UNSCORABLE = -1
+
+
+# full_process'ed text, or None for NaN / non-string descriptions that cannot be scored
+def normalize(text):
+    return utils.full_process(text) if isinstance(text, str) else None
+
+
+# Descriptions normalized once, for repeated scoring: the full_process'ed
+# strings, the distinct ones and which distinct string each position holds,
+# and their token sets. Positions map back to rows of the frame the choices
+# came from. Built once per SOR header group; duplicate descriptions are
+# scored once and nothing is re-processed per query.
+class ChoiceCorpus:
+    def __init__(self, choices, processed=None, positions=None):
+        self.choices = list(choices)
+        self.processed = [normalize(c) for c in self.choices] if processed is None else list(processed)
+        self.positions = np.arange(len(self.choices)) if positions is None else np.asarray(positions, dtype=np.intp)
+        distinct = {}
+        self.inverse = np.array([distinct.setdefault(p, len(distinct)) if p is not None else -1 for p in self.processed],
+                                dtype=np.intp)
+        self.unique = list(distinct)
+        self._tokens = None
+        self._rf_processed = None
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.choices)
+
+    # Word sets of the normalized strings (empty for unscorable choices)
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = [set(p.split()) if p is not None else set() for p in self.processed]
+        return self._tokens
+
+    # Same strings normalized the way rapidfuzz's default_process does
+    @property
+    def rf_processed(self):
+        if self._rf_processed is None:
+            self._rf_processed = [rf_utils.default_process(c) if isinstance(c, str) else None for c in self.choices]
+        return self._rf_processed
+
+    # The choices at the given positions, sharing this corpus's normalized strings
+    def subset(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        corpus = ChoiceCorpus([self.choices[j] for j in positions], [self.processed[j] for j in positions],
+                              self.positions[positions])
+        if self._tokens is not None:
+            corpus._tokens = [self._tokens[j] for j in positions]
+        if self._rf_processed is not None:
+            corpus._rf_processed = [self._rf_processed[j] for j in positions]
+        return corpus
+
+    # CandidateIndex over this corpus, built on first use
+    def index(self, ngram=3):
+        if ngram not in self._indexes:
+            self._indexes[ngram] = CandidateIndex(self, ngram)
+        return self._indexes[ngram]
+
+
+def as_corpus(choices):
+    return choices if isinstance(choices, ChoiceCorpus) else ChoiceCorpus(choices)
+
+
+# Same scores as process.extractOne(query, choices, scorer=fuzz.partial_ratio).
+# Queries and choices are normalized once (or come as ChoiceCorpus objects
+# already normalized) and every distinct pair of strings is scored once.
+def fuzzywuzzy_scores(queries, choices, workers=None):
+    queries, choices = as_corpus(queries), as_corpus(choices)
+    unique_scores = np.empty((len(queries.unique), len(choices.unique)), dtype=np.int16)
+    for a, query in enumerate(queries.unique):
+        for b, choice in enumerate(choices.unique):
+            unique_scores[a, b] = fuzz.partial_ratio(query, choice)
+    return _expand(unique_scores, queries.inverse, choices.inverse)
+
+
+# Per-position scores from the scores of the distinct strings
+def _expand(unique_scores, rows, columns):
+    scores = np.full((len(rows), len(columns)), UNSCORABLE, dtype=np.int16)
+    scorable_rows = np.flatnonzero(rows >= 0)
+    scorable_columns = np.flatnonzero(columns >= 0)
+    if len(scorable_rows) and len(scorable_columns):
+        scores[np.ix_(scorable_rows, scorable_columns)] = unique_scores[np.ix_(rows[scorable_rows], columns[scorable_columns])]
+    return scores
+
+
+# Multithreaded C scorer. rapidfuzz's partial_ratio searches every alignment, so
+# its scores are never lower than fuzzywuzzy's and are often a few points higher.
+def rapidfuzz_scores(queries, choices, workers=-1):
+    if rf_process is None:
+        raise ImportError("The 'rapidfuzz' backend needs the rapidfuzz package: pip install rapidfuzz")
+    queries, choices = as_corpus(queries), as_corpus(choices)
+    scorable = [j for j, c in enumerate(choices.rf_processed) if c is not None]
+    scores = np.full((len(queries), len(choices)), UNSCORABLE, dtype=np.int16)
+    if len(queries) and scorable:
+        result = rf_process.cdist(
+            queries.rf_processed,
+            [choices.rf_processed[j] for j in scorable],
+            scorer=rf_fuzz.partial_ratio,
+            processor=None,
+            workers=workers,
+        )
+        scores[:, scorable] = np.rint(result)
+    return scores
+
+
+BACKENDS = {
+    "fuzzywuzzy": fuzzywuzzy_scores,
+    "rapidfuzz": rapidfuzz_scores,
+}
+
+
+# Scorers that take ChoiceCorpus objects; other backends get plain lists
+_CORPUS_BACKENDS = {fuzzywuzzy_scores, rapidfuzz_scores}
+
+
+# Plug in another scorer. fn(queries, choices, workers) must return an
+# (len(queries), len(choices)) integer matrix on the 0-100 scale
+def register_backend(name, fn):
+    BACKENDS[name] = fn
+
+
+def _score(scorer, queries, choices, workers):
+    if scorer in _CORPUS_BACKENDS:
+        return scorer(queries, choices, workers)
+    return scorer(queries.choices, choices.choices, workers)
+
+
+def get_backend(name=None):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown matching backend '{name}'. Available: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+# Score every query against every choice in one call.
+# Returns the score matrix and, per query, the index of the best choice
+# (first one on ties, like extractOne) or -1 when nothing could be scored.
+def match_matrix(queries, choices, backend=None, workers=-1):
+    queries, choices = as_corpus(queries), as_corpus(choices)
+    scores = _score(get_backend(backend), queries, choices, workers)
+    if scores.shape[1] == 0:
+        return scores, np.full(len(queries), -1, dtype=np.intp)
+    best = scores.argmax(axis=1)
+    best[scores[np.arange(len(queries)), best] == UNSCORABLE] = -1
+    return scores, best
+
+
+# Options for the candidate blocking stage (pass to compare(..., blocking=Blocking()))
+@dataclass
+class Blocking:
+    top_k: int = 20                         # candidates scored per ACMV description
+    ngram: int = 3                          # character n-gram length used as index keys
+    fallback_score: int = SCORE_THRESHOLD   # rescan everything when the best candidate scores <= this
+    full_scan_fallback: bool = True         # set False to never fall back to a full scan
+
+
+# Word tokens plus character n-grams of each token, on full_process'ed text
+def blocking_keys(text, ngram=3):
+    if not isinstance(text, str):
+        return set()
+    return token_keys(utils.full_process(text).split(), ngram)
+
+
+def token_keys(tokens, ngram=3):
+    keys = set()
+    for token in tokens:
+        keys.add(token)
+        for k in range(len(token) - ngram + 1):
+            keys.add("#" + token[k:k + ngram])
+    return keys
+
+
+# Inverted index from blocking keys to choice positions for one SOR group.
+# choices can be a list or a ChoiceCorpus (whose token sets are reused).
+class CandidateIndex:
+    def __init__(self, choices, ngram=3):
+        choices = as_corpus(choices)
+        self.size = len(choices)
+        self.ngram = ngram
+        postings = defaultdict(list)
+        for j, tokens in enumerate(choices.tokens):
+            for key in token_keys(tokens, ngram):
+                postings[key].append(j)
+        # Keys shared by every choice get zero weight, rare keys count the most
+        self.postings = {key: np.array(rows, dtype=np.intp) for key, rows in postings.items()}
+        self.weights = {key: math.log(self.size / len(rows)) for key, rows in postings.items()}
+
+    # Positions of the top_k choices sharing the most (idf-weighted) keys with query,
+    # in ascending position order so score ties resolve like a full scan.
+    # query is a description or, already normalized, its token set.
+    def candidates(self, query, top_k=20):
+        overlap = np.zeros(self.size)
+        hit = np.zeros(self.size, dtype=bool)
+        keys = token_keys(query, self.ngram) if isinstance(query, (set, frozenset)) else blocking_keys(query, self.ngram)
+        for key in keys:
+            rows = self.postings.get(key)
+            if rows is not None:
+                overlap[rows] += self.weights[key]
+                hit[rows] = True
+        found = np.flatnonzero(hit)
+        if len(found) > top_k:
+            order = np.argsort(-overlap[found], kind="stable")[:top_k]
+            found = found[order]
+        return np.sort(found)
+
+
+# Best choice and its score for every query. With blocking=None every pair is
+# scored; otherwise only each query's candidates are, plus a full scan for
+# queries left without candidates or without a convincing match.
+# A match_cache.MatchCache passed as cache answers repeat queries without scoring.
+# queries and choices can be lists or ChoiceCorpus objects built earlier.
+def best_matches(queries, choices, backend=None, blocking=None, workers=-1, stats=None, cache=None):
+    queries, choices = as_corpus(queries), as_corpus(choices)
+    if cache is not None:
+        return _cached_best_matches(queries, choices, backend, blocking, workers, stats, cache)
+    if blocking is None:
+        scores, best = match_matrix(queries, choices, backend=backend, workers=workers)
+        best_scores = np.full(len(queries), UNSCORABLE, dtype=np.int16)
+        found = best >= 0
+        best_scores[found] = scores[found.nonzero()[0], best[found]]
+        if stats is not None:
+            stats["pairs_scored"] = stats.get("pairs_scored", 0) + len(queries) * len(choices)
+        return best, best_scores
+
+    scorer = get_backend(backend)
+    index = choices.index(blocking.ngram)
+    best = np.full(len(queries), -1, dtype=np.intp)
+    best_scores = np.full(len(queries), UNSCORABLE, dtype=np.int16)
+    pairs_scored = 0
+    rescan = []
+    for i, tokens in enumerate(queries.tokens):
+        found = index.candidates(tokens, blocking.top_k)
+        if len(found):
+            scores = _score(scorer, queries.subset([i]), choices.subset(found), workers)[0]
+            pairs_scored += len(found)
+            k = scores.argmax()
+            if scores[k] != UNSCORABLE:
+                best[i], best_scores[i] = found[k], scores[k]
+        if blocking.full_scan_fallback and (best[i] < 0 or best_scores[i] <= blocking.fallback_score):
+            rescan.append(i)
+
+    if rescan and len(choices):
+        scores, rescan_best = match_matrix(queries.subset(rescan), choices, backend=backend, workers=workers)
+        pairs_scored += len(rescan) * len(choices)
+        for r, i in enumerate(rescan):
+            j = rescan_best[r]
+            best[i] = j
+            best_scores[i] = scores[r, j] if j >= 0 else UNSCORABLE
+
+    if stats is not None:
+        stats["pairs_scored"] = stats.get("pairs_scored", 0) + pairs_scored
+        stats["full_scans"] = stats.get("full_scans", 0) + len(rescan)
+    return best, best_scores
+
+
+def _cached_best_matches(queries, choices, backend, blocking, workers, stats, cache):
+    group = cache.group_key(choices.choices, backend, blocking)
+    keys = [cache.processed_query_key(query) for query in queries.processed]
+    found = cache.get_many(group, keys)
+
+    # Only score the queries the cache has not seen (each distinct one once)
+    missing = {}
+    for i, key in enumerate(keys):
+        if key not in found and key not in missing:
+            missing[key] = i
+    if missing:
+        rows = list(missing.values())
+        best, best_scores = best_matches(queries.subset(rows), choices, backend, blocking, workers, stats)
+        computed = {}
+        for key, j, score in zip(missing, best, best_scores):
+            computed[key] = (j, choices.choices[j] if j >= 0 and isinstance(choices.choices[j], str) else None, score)
+        cache.put_many(group, computed)
+        found.update(computed)
+
+    best = np.array([found[key][0] for key in keys], dtype=np.intp)
+    best_scores = np.array([found[key][2] for key in keys], dtype=np.int16)
+    return best, best_scores
+
+
+# How much a blocking configuration gives up against exhaustive matching.
+# recall is the share of queries that get the same SOR row, score_recall the
+# share that get the same best score (possibly from an equally good row).
+def blocking_recall(queries, choices, blocking=None, backend=None, workers=-1):
+    blocking = blocking or Blocking()
+    queries, choices = as_corpus(queries), as_corpus(choices)
+    exhaustive_stats, blocked_stats = {}, {}
+    exact_best, exact_scores = best_matches(queries, choices, backend, None, workers, exhaustive_stats)
+    blocked_best, blocked_scores = best_matches(queries, choices, backend, blocking, workers, blocked_stats)
+    total = len(exact_best)
+    return {
+        "queries": total,
+        "recall": float((blocked_best == exact_best).mean()) if total else 1.0,
+        "score_recall": float((blocked_scores == exact_scores).mean()) if total else 1.0,
+        "pairs_scored": blocked_stats["pairs_scored"],
+        "pairs_exhaustive": exhaustive_stats["pairs_scored"],
+        "full_scans": blocked_stats["full_scans"],
+    }
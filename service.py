@@ -0,0 +1,157 @@
+# service.py
+# Local HTTP service for submitting workbooks from other programs:
+#
+#   python service.py --port 8080 --workers 4 --max-queued 16
+#
+#   curl --data-binary @project.xlsx http://localhost:8080/jobs      -> 202 {"id": ..., "status": "queued", ...}
+#   curl http://localhost:8080/jobs/<id>                            -> {"status": "running", "progress": {...}}
+#   curl -o ACMV.xlsx http://localhost:8080/jobs/<id>/result        -> the output workbook once done
+#   curl http://localhost:8080/metrics                              -> queue depth, latency, throughput
+#
+# Jobs run in a JobManager process pool (the same one the app uses). A job's id
+# is the sha256 of the upload, so submitting the same workbook again returns the
+# running or finished job. When max-queued jobs are already waiting, POST /jobs
+# answers 503 with Retry-After instead of queueing more.
+
+import argparse
+import json
+import sys
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from jobs import JobManager, QueueFull
+
+# Seconds a client is asked to wait before retrying a rejected or unfinished request
+RETRY_AFTER = 5
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class ComparisonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, manager, max_upload_bytes=100 * 2**20):
+        super().__init__(address, ServiceHandler)
+        self.manager = manager
+        self.max_upload_bytes = max_upload_bytes
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "SORComparison/1.0"
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, indent=2).encode("utf-8"), "application/json", headers)
+
+    def _parts(self):
+        return [part for part in urlsplit(self.path).path.split("/") if part]
+
+    def do_POST(self):
+        if self._parts() != ["jobs"]:
+            return self._json(404, {"error": "Not found"})
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._json(411, {"error": "Content-Length is required"})
+        if not length.strip().isdigit():
+            # The body cannot be told from the next request, so the connection is closed after answering
+            self.close_connection = True
+            return self._json(400, {"error": f"Invalid Content-Length: {length!r}"})
+        length = int(length)
+        if length > self.server.max_upload_bytes:
+            # Drained without keeping it, so the client gets the answer rather than a reset connection
+            while length > 0:
+                length -= len(self.rfile.read(min(length, 2**16))) or length
+            return self._json(413, {"error": f"Uploads are limited to {self.server.max_upload_bytes} bytes"})
+        data = self.rfile.read(length)
+        if not data:
+            return self._json(400, {"error": "Send the workbook as the request body"})
+
+        try:
+            job = self.server.manager.submit(data)
+        except (QueueFull, BrokenProcessPool) as e:
+            return self._json(503, {"error": str(e)}, {"Retry-After": str(RETRY_AFTER)})
+        except Exception as e:
+            # Answer rather than dropping the connection; the traceback goes to the log
+            self.log_error("submit failed: %s", traceback.format_exc())
+            return self._json(500, {"error": f"{type(e).__name__}: {e}"})
+        status = 200 if job.done else 202
+        self._json(status, job_status(job), {"Location": f"/jobs/{job.key}"})
+
+    def do_GET(self):
+        parts = self._parts()
+        if parts == ["health"]:
+            return self._json(200, {"status": "ok"})
+        if parts == ["metrics"]:
+            return self._json(200, self.server.manager.metrics())
+        if len(parts) not in (2, 3) or parts[0] != "jobs" or (len(parts) == 3 and parts[2] not in ("result", "timings")):
+            return self._json(404, {"error": "Not found"})
+
+        job = self.server.manager.get(parts[1])
+        if job is None:
+            return self._json(404, {"error": f"No job {parts[1]}"})
+        if len(parts) == 2:
+            return self._json(200, job_status(job))
+        if not job.done:
+            return self._json(409, job_status(job), {"Retry-After": str(RETRY_AFTER)})
+        if job.failed:
+            return self._json(500, job_status(job))
+        output, report = job.result()
+        if parts[2] == "timings":
+            return self._json(200, report)
+        self._send(200, output, XLSX_TYPE,
+                   {"Content-Disposition": f'attachment; filename="ACMV_{job.key[:12]}.xlsx"'})
+
+
+# What GET /jobs/<id> returns
+def job_status(job):
+    status = {
+        "id": job.key,
+        "status": job.status,
+        "submitted": job.submitted,
+        "finished": job.finished,
+        "latency_seconds": job.finished - job.submitted if job.finished is not None else None,
+        "status_url": f"/jobs/{job.key}",
+        "result_url": f"/jobs/{job.key}/result",
+    }
+    if not job.done:
+        status["progress"] = job.progress()
+    if job.failed:
+        error = job.future.exception()
+        status["error"] = f"{type(error).__name__}: {error}"
+    return status
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Serve SOR comparisons over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="comparisons run at once (default: half the CPUs)")
+    parser.add_argument("--max-queued", type=int, default=16, help="jobs allowed to wait for a worker before rejecting")
+    parser.add_argument("--max-upload-mb", type=float, default=100, help="largest accepted workbook")
+    parser.add_argument("--result-dir", help="where finished results are kept (default: the app's result cache)")
+    args = parser.parse_args(argv)
+
+    manager = JobManager(args.workers, args.result_dir, max_queued=args.max_queued, quiet=True)
+    server = ComparisonServer((args.host, args.port), manager, int(args.max_upload_mb * 2**20))
+    print(f"Serving on http://{args.host}:{server.server_port} with {manager.max_workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -1,139 +1,498 @@
-# import streamlit as st
-# import pandas as pd
-# import fitz  # PyMuPDF
-# import re
-# import textwrap
-# import io
-
-# def extract_items_from_pdf(file):
-#     doc = fitz.open(stream=file.read(), filetype="pdf")
-#     data = []
-#     pattern = re.compile(r'\b(A\d{6})\b')
-
-#     for page_num in range(len(doc)):
-#         blocks = doc.load_page(page_num).get_text("blocks")
-#         blocks = sorted(blocks, key=lambda b: b[1])
-
-#         for block in blocks:
-#             lines = block[4].split('\n')
-#             for line in lines:
-#                 line = line.strip()
-#                 if not line:
-#                     continue
-#                 match = pattern.search(line)
-#                 if match:
-#                     item_no = match.group(1)
-#                     desc = line.replace(item_no, '').strip()
-#                     data.append({"Item No.": item_no, "Description": desc})
-#                 elif data:
-#                     data[-1]["Description"] += ' ' + line.strip()
-
-#     if not data:
-#         return pd.DataFrame(columns=["Item No.", "Description", "Unit", "Rate (S$)"])
-
-#     for item in data:
-#         words = item["Description"].split()
-#         wrapped = textwrap.wrap(" ".join(words), width=90)
-#         item["Description"] = "\n".join(wrapped)
-
-#     df = pd.DataFrame(data)
-
-#     unit_rate_pattern = re.compile(r'(Unit|No|Set|Each|Lot)?\s*[\$S]?([\d,]+\.\d{2})')
-#     units, rates = [], []
-#     for desc in df["Description"].str.replace('\n', ' '):
-#         match = unit_rate_pattern.search(desc)
-#         if match:
-#             units.append(match.group(1) or '')
-#             rates.append(match.group(2))
-#         else:
-#             units.append('')
-#             rates.append('')
-#     df["Unit"] = units
-#     df["Rate (S$)"] = rates
-
-#     return df
-
-# st.title("PDF Item Extractor")
-# st.markdown("Upload a PDF file with structured item data. The app will extract Item No, Description, Unit, and Rate, and allow you to download the results as an Excel file.")
-
-# uploaded_file = st.file_uploader("Upload PDF", type="pdf")
-
-# if uploaded_file:
-#     df = extract_items_from_pdf(uploaded_file)
-
-#     if df.empty:
-#         st.warning("No items were extracted from the uploaded PDF. Please check the format.")
-#     else:
-#         st.success("Extraction completed!")
-#         st.dataframe(df)
-
-#         buffer = io.BytesIO()
-#         df.to_excel(buffer, index=False)
-#         buffer.seek(0)
-
-#         st.download_button(
-#             label="Download as Excel",
-#             data=buffer,
-#             file_name="extracted_items.xlsx",
-#             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-#         )
-
 # sor_converter.py
 
+import csv
 import fitz  # PyMuPDF
+import hashlib
+import numpy as np
+import os
 import pandas as pd
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from extraction_cache import file_hash
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # without pyarrow lines are classified one at a time
+    pa = None
+
+pattern_item = re.compile(r'\b([A-Z0-9]{6,})\b')
+pattern_rate = re.compile(r'(Unit|No|Set|Each|Lot|Sys|m|kg|pair|Pa|RT|kW|Job|Per Job)?\s*[\$S]?([\d,]+\.\d{2})')
+# Section headers like A110000
+pattern_header = re.compile(r'[A-Z]{1,3}\d{4}00')
+
+# Number of header lines captured after a section code
+HEADER_LINES = 6
+
+ITEM_COLUMNS = ["Item No.", "Header", "Description", "Unit", "Rate (S$)"]
+
+# Extracted item columns -> the SOR sheet columns final.main works with
+SOR_COLUMNS = {"Item No.": "ITEM NO.", "Header": "HEADER NAME", "Description": "DESCRIPTION", "Unit": "UNIT", "Rate (S$)": "RATE"}
+
+# Bump when parse_line changes in a way the patterns above do not show;
+# cached extraction results from other rule versions are then ignored
+RULES_VERSION = 1
+
+# Bump when page_key changes; page keys stored for a document are then recomputed
+PAGE_KEY_VERSION = 3
+
+# Pages read from / written to the extraction cache per round trip
+CACHE_WINDOW = 64
+
+# Pages whose lines are classified together in one batch
+PAGE_BATCH = 64
+
+
+# The patterns above for Arrow's RE2 engine, which matches the same on ASCII
+# text once \s is spelled out (RE2's leaves out \v and \x1c-\x1f) and every
+# capture group is named
+def _re2(pattern, names=()):
+    names = iter(names)
+    pattern = re.sub(r'(?<!\\)\((?!\?)', lambda match: f"(?P<{next(names)}>", pattern)
+    return pattern.replace(r'\s', r'[\t\n\x0b\f\r \x1c-\x1f]')
+
+
+HEADER = ("header",)
+TEXT = ("text",)
+
+arrow_header = '^' + _re2(pattern_header.pattern) + '$'
+arrow_item = '^' + _re2(pattern_item.pattern, ["item_no"])
+arrow_rate = '(?P<text>' + _re2(pattern_rate.pattern, ["unit", "rate"]) + ')'
+
+
+# pdf_path throughout can also be the PDF's bytes or a binary buffer
+def open_pdf(source):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    if hasattr(source, "read"):
+        source.seek(0)
+        return fitz.open(stream=source.read(), filetype="pdf")
+    return fitz.open(source)
+
+
+# Pool workers get bytes rather than a buffer, which cannot be shared
+def _portable(source):
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source.read()
+    return source
+
+
+# Version of the line classification rules, part of every extraction cache key
+def rules_version():
+    rules = (RULES_VERSION, pattern_item.pattern, pattern_rate.pattern, pattern_header.pattern)
+    return hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()[:16]
+
 
-def extract_structured_items_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    pattern_item = re.compile(r'\b([A-Z0-9]{6,})\b')
-    pattern_rate = re.compile(r'(Unit|No|Set|Each|Lot|Sys|m|kg|pair|Pa|RT|kW|Job|Per Job)?\s*[\$S]?([\d,]+\.\d{2})')
+# Classify one stripped line without any header state:
+# ("header",), ("item", item_no, description, unit, rate) or ("text",)
+def parse_line(line):
+    if pattern_header.fullmatch(line):
+        return ("header",)
 
-    data = []
+    match = pattern_item.match(line)
+    if match:
+        item_no = match.group(1)
+        remaining = line.replace(item_no, '').strip()
+
+        unit, rate = '', ''
+        match_rate = pattern_rate.search(line)
+        if match_rate:
+            unit = match_rate.group(1) or ''
+            rate = match_rate.group(2)
+            remaining = remaining.replace(match_rate.group(0), '').strip()
+        return ("item", item_no, remaining, unit, rate)
+    return ("text",)
+
+
+# parse_line for a batch of lines. The three patterns run over the whole batch
+# in Arrow, so Python only assembles the items; lines with non-ASCII text,
+# where RE2 and re disagree on \b, \d and \s, go through parse_line.
+def parse_lines(lines):
+    if pa is None or not lines:
+        return [parse_line(line) for line in lines]
+    array = pa.array(lines, pa.string())
+    ascii = pc.string_is_ascii(array).to_pylist()
+    headers = pc.match_substring_regex(array, arrow_header).to_pylist()
+    item_nos = pc.extract_regex(array, arrow_item).flatten()[0].to_pylist()
+    rate_texts, units, rates = (field.to_pylist() for field in pc.extract_regex(array, arrow_rate).flatten())
+
+    parsed = []
+    for line, is_ascii, header, item_no, rate_text, unit, rate in zip(
+            lines, ascii, headers, item_nos, rate_texts, units, rates):
+        if not is_ascii:
+            parsed.append(parse_line(line))
+        elif header:
+            parsed.append(HEADER)
+        elif item_no is None:
+            parsed.append(TEXT)
+        elif rate_text is None:
+            parsed.append(("item", item_no, line.replace(item_no, '').strip(), '', ''))
+        else:
+            remaining = line.replace(item_no, '').strip().replace(rate_text, '').strip()
+            parsed.append(("item", item_no, remaining, unit, rate))
+    return parsed
+
+
+def text_lines(page):
+    return [line for line in (raw.strip() for raw in page.get_text().split('\n')) if line]
+
+
+# Non-empty stripped lines of each page with their classification, one list per page
+def pages_lines(pages):
+    per_page = [text_lines(page) for page in pages]
+    parsed = iter(parse_lines([line for lines in per_page for line in lines]))
+    return [[(line, next(parsed)) for line in lines] for lines in per_page]
+
+
+def page_lines(page):
+    return pages_lines([page])[0]
+
+
+# Non-empty stripped lines of pages [start, stop) with their classification,
+# classified PAGE_BATCH pages at a time
+def iter_page_lines(pdf_path, start=0, stop=None):
+    doc = open_pdf(pdf_path)
+    try:
+        stop = len(doc) if stop is None else min(stop, len(doc))
+        for batch in range(start, stop, PAGE_BATCH):
+            for lines in pages_lines([doc[page_no] for page_no in range(batch, min(batch + PAGE_BATCH, stop))]):
+                yield from lines
+    finally:
+        doc.close()
+
+
+def extract_page_lines(pdf_path, start=0, stop=None):
+    return list(iter_page_lines(pdf_path, start, stop))
+
+
+# Header state machine over classified lines, in document order. A section
+# code starts a capture of the next HEADER_LINES lines as the current header.
+def iter_items(parsed_lines):
     current_header = ""
     capture_next_lines = False
     header_lines = []
 
-    for page in doc:
-        lines = page.get_text().split('\n')
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if not line:
-                continue
+    for line, parsed in parsed_lines:
+        if parsed[0] == "header":
+            capture_next_lines = True
+            header_lines = []
+            continue
 
-            # Detect section headers like A110000
-            if re.fullmatch(r'[A-Z]{1,3}\d{4}00', line):
-                capture_next_lines = True
-                header_lines = []
+        if capture_next_lines:
+            if len(header_lines) < HEADER_LINES:
+                header_lines.append(line)
                 continue
+            else:
+                current_header = " ".join(header_lines).strip()
+                capture_next_lines = False
+                continue
+
+        if parsed[0] == "item":
+            _, item_no, remaining, unit, rate = parsed
+            yield {
+                "Item No.": item_no,
+                "Header": current_header,
+                "Description": remaining,
+                "Unit": unit,
+                "Rate (S$)": rate
+            }
+
+
+def assemble_items(parsed_lines):
+    return list(iter_items(parsed_lines))
+
+
+# iter_items for a whole document at once, as a DataFrame. Only the section
+# codes are walked in Python: each one either completes its header on the
+# (HEADER_LINES + 1)th line after it or is cut short by the next code, and
+# every item takes the header completed last before it.
+def items_frame(parsed_lines):
+    parsed_lines = list(parsed_lines)
+    count = len(parsed_lines)
+    codes = [n for n, (_, parsed) in enumerate(parsed_lines) if parsed[0] == "header"]
+    skipped = np.zeros(count, dtype=bool)
+    completed_at = []
+    headers = []
+    for code, next_code in zip(codes, codes[1:] + [count]):
+        end = code + HEADER_LINES + 1
+        if next_code <= end or end >= count:
+            skipped[code + 1:next_code] = True
+            continue
+        skipped[code + 1:end + 1] = True
+        completed_at.append(end)
+        headers.append(" ".join(line for line, _ in parsed_lines[code + 1:end]).strip())
+
+    rows = [n for n, (_, parsed) in enumerate(parsed_lines) if parsed[0] == "item" and not skipped[n]]
+    latest = np.searchsorted(np.array(completed_at, dtype=np.int64), np.array(rows, dtype=np.int64)) - 1
+    header_column = [headers[n] if n >= 0 else "" for n in latest]
+    items = [parsed_lines[n][1] for n in rows]
+    return pd.DataFrame({
+        "Item No.": [item[1] for item in items],
+        "Header": header_column,
+        "Description": [item[2] for item in items],
+        "Unit": [item[3] for item in items],
+        "Rate (S$)": [item[4] for item in items],
+    }, columns=ITEM_COLUMNS, dtype=object)
+
+
+# Split [0, page_count) into page ranges of at most pages_per_chunk pages
+def page_ranges(page_count, pages_per_chunk):
+    return [(start, min(start + pages_per_chunk, page_count)) for start in range(0, page_count, pages_per_chunk)]
+
+
+def _extract_range(args):
+    pdf_path, start, stop = args
+    return extract_page_lines(pdf_path, start, stop)
+
+
+def _extract_pages(args):
+    pdf_path, page_numbers = args
+    with open_pdf(pdf_path) as doc:
+        return list(zip(page_numbers, pages_lines([doc[page_no] for page_no in page_numbers])))
+
+
+# Indirect references ("12 0 R") in a PDF object's source
+pattern_reference = re.compile(r'\b(\d+) \d+ R\b')
+
+
+# Extraction cache key of a page: its raw content stream, fonts and geometry,
+# and every object its resources reach (Form XObjects, images, fonts and their
+# streams). Pages whose text sits in Form XObjects all have the same content
+# stream ("q /fzFrm0 Do Q"), so that alone does not tell them apart.
+# Object numbers are left out: references are renumbered in the order the
+# objects are first reached, so a page keeps its key when a re-issued PDF
+# inserts or removes pages before it and every later object is renumbered.
+# object_digests memoizes per-object sources and stream digests across the
+# pages of one document.
+def page_key(page, version=None, object_digests=None):
+    digest = hashlib.sha256((version or rules_version()).encode("utf-8"))
+    digest.update(page.read_contents())
+    # Font entries without their own and their referencer's xref
+    fonts = [font[1:6] for font in page.get_fonts()]
+    digest.update(repr((fonts, tuple(page.rect), page.rotation)).encode("utf-8"))
+    doc = page.parent
+    if object_digests is None:
+        object_digests = {}
+    numbers = {}
+    pending = deque()
+
+    def renumber(match):
+        xref = int(match.group(1))
+        if xref not in numbers:
+            numbers[xref] = len(numbers)
+            pending.append(xref)
+        return f"#{numbers[xref]} R"
+
+    digest.update(pattern_reference.sub(renumber, _page_resources(doc, page.xref)).encode("utf-8"))
+    while pending:
+        source, stream_digest = _object_source(doc, pending.popleft(), object_digests)
+        digest.update(pattern_reference.sub(renumber, source).encode("utf-8") + stream_digest)
+    return digest.hexdigest()
+
+
+# Source of a page's /Resources entry, inherited from the page tree when the page has none
+def _page_resources(doc, xref):
+    while xref:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, value = doc.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return ""
+
+
+# (source, digest of the raw stream) of a PDF object, memoized in object_digests.
+# Pages and the page tree stand in as "/Page" so one page never pulls in the others.
+def _object_source(doc, xref, object_digests):
+    if xref not in object_digests:
+        if not 0 < xref < doc.xref_length():
+            object_digests[xref] = ("null", b"")
+        elif doc.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages"):
+            object_digests[xref] = ("/Page", b"")
+        else:
+            stream = doc.xref_stream_raw(xref) if doc.xref_is_stream(xref) else None
+            object_digests[xref] = (doc.xref_object(xref, compressed=True),
+                                    hashlib.sha256(stream).digest() if stream else b"")
+    return object_digests[xref]
+
+
+# Extract the given pages in a process pool and store them in the cache
+def _fill_cache_parallel(pdf_path, cache, page_keys, missing, workers, pages_per_chunk=None):
+    if pages_per_chunk is None:
+        pages_per_chunk = max(1, -(-len(missing) // (workers * 4)))
+    batches = iter([missing[start:start + pages_per_chunk] for start in range(0, len(missing), pages_per_chunk)])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_extract_pages, (pdf_path, batch)) for batch in islice(batches, workers * 2))
+        while pending:
+            done = pending.popleft().result()
+            for batch in islice(batches, 1):
+                pending.append(executor.submit(_extract_pages, (pdf_path, batch)))
+            cache.put_pages({page_keys[page_no]: lines for page_no, lines in done})
+
+
+# Classified lines in page order, served from an extraction_cache.ExtractionCache
+# where possible. Only pages the cache has not seen are extracted.
+def _iter_cached_lines(pdf_path, cache, workers=None, pages_per_chunk=None):
+    version = rules_version()
+    pdf_path = _portable(pdf_path)
+    document_key = f"{version}:{PAGE_KEY_VERSION}:{file_hash(pdf_path)}"
+    doc = open_pdf(pdf_path)
+    try:
+        page_keys = cache.get_document(document_key)
+        if page_keys is None or len(page_keys) != len(doc):
+            object_digests = {}
+            page_keys = [page_key(page, version, object_digests) for page in doc]
+            cache.put_document(document_key, page_keys)
+
+        filled = set()
+        if workers and workers > 1:
+            cached = cache.contains(page_keys)
+            missing = [page_no for page_no, key in enumerate(page_keys) if key not in cached]
+            if missing:
+                _fill_cache_parallel(pdf_path, cache, page_keys, missing, workers, pages_per_chunk)
+                cache.misses += len(missing)
+                filled = set(missing)
+
+        # Pages are read and stored a window at a time to keep memory bounded
+        for start in range(0, len(page_keys), CACHE_WINDOW):
+            window = range(start, min(start + CACHE_WINDOW, len(page_keys)))
+            found = cache.get_pages([page_keys[n] for n in window if n not in filled])
+            if filled:
+                found.update(cache.get_pages([page_keys[n] for n in window if n in filled], count=False))
+            # Not cached, or evicted while the rest of the document was filled in
+            missing = {}
+            for page_no in window:
+                if page_keys[page_no] not in found:
+                    missing.setdefault(page_keys[page_no], page_no)
+            fresh = dict(zip(missing, pages_lines([doc[page_no] for page_no in missing.values()])))
+            cache.put_pages(fresh)
+            for page_no in window:
+                key = page_keys[page_no]
+                yield from found[key] if key in found else fresh[key]
+    finally:
+        doc.close()
+
+
+# Classified lines of page ranges extracted in a process pool, in page order.
+# Only a few ranges are in flight at a time so memory stays bounded.
+def _iter_parallel_lines(pdf_path, workers, pages_per_chunk=None):
+    pdf_path = _portable(pdf_path)
+    with open_pdf(pdf_path) as doc:
+        page_count = len(doc)
+    if pages_per_chunk is None:
+        # A few chunks per worker keeps the pool busy when pages differ in size
+        pages_per_chunk = max(1, -(-page_count // (workers * 4)))
+    ranges = iter(page_ranges(page_count, pages_per_chunk))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_extract_range, (pdf_path, start, stop))
+                        for start, stop in islice(ranges, workers * 2))
+        while pending:
+            chunk = pending.popleft().result()
+            for start, stop in islice(ranges, 1):
+                pending.append(executor.submit(_extract_range, (pdf_path, start, stop)))
+            yield from chunk
+
+
+# Items one dict at a time as pages are processed. workers > 1 extracts page
+# ranges in separate processes (each opening its own document) and runs the
+# header state machine over the merged lines in page order, so the items are
+# identical to a serial run. cache (an extraction_cache.ExtractionCache) skips
+# text extraction for pages seen before.
+def iter_structured_items(pdf_path, workers=None, pages_per_chunk=None, cache=None):
+    if cache is not None:
+        return iter_items(_iter_cached_lines(pdf_path, cache, workers, pages_per_chunk))
+    if not workers or workers <= 1:
+        return iter_items(iter_page_lines(pdf_path))
+    return iter_items(_iter_parallel_lines(pdf_path, workers, pages_per_chunk))
+
+
+# Items as DataFrames of at most chunk_size rows
+def iter_item_chunks(pdf_path, chunk_size=10000, workers=None, pages_per_chunk=None, cache=None):
+    items = iter_structured_items(pdf_path, workers, pages_per_chunk, cache)
+    while True:
+        rows = list(islice(items, chunk_size))
+        if not rows:
+            return
+        yield pd.DataFrame(rows, columns=ITEM_COLUMNS)
+
+
+# Stream the items straight to a .csv, .parquet or .xlsx file without holding
+# the whole document in memory. Returns the number of items written.
+def write_items(pdf_path, output, format=None, chunk_size=10000, workers=None, pages_per_chunk=None, cache=None):
+    format = (format or os.path.splitext(str(output))[1].lstrip(".")).lower()
+    chunks = iter_item_chunks(pdf_path, chunk_size, workers, pages_per_chunk, cache)
+    if format == "csv":
+        return _write_csv(chunks, output)
+    if format == "parquet":
+        return _write_parquet(chunks, output)
+    if format == "xlsx":
+        return _write_xlsx(chunks, output)
+    raise ValueError(f"Unsupported output format '{format}'. Use csv, parquet or xlsx.")
+
+
+def _write_csv(chunks, output):
+    count = 0
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(ITEM_COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk.itertuples(index=False, name=None))
+            count += len(chunk)
+    return count
+
+
+def _write_parquet(chunks, output):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing parquet needs pyarrow: pip install pyarrow")
+    schema = pa.schema([(column, pa.string()) for column in ITEM_COLUMNS])
+    count = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            count += len(chunk)
+    return count
+
+
+def _write_xlsx(chunks, output):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Items")
+    ws.append(ITEM_COLUMNS)
+    count = 0
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(list(row))
+        count += len(chunk)
+    wb.save(output)
+    return count
+
+
+# Extracted items in the SOR sheet layout, with rates as floats ("1,234.00" -> 1234.0, "" -> NaN)
+def items_to_sor(items):
+    sor = items.reindex(columns=ITEM_COLUMNS).rename(columns=SOR_COLUMNS)
+    sor["RATE"] = pd.to_numeric(sor["RATE"].astype(str).str.replace(",", "", regex=False), errors="coerce")
+    return sor
+
+
+# A SOR PDF as the HEADER NAME / DESCRIPTION / UNIT / RATE frame final.main compares,
+# straight from the extractor with no workbook in between
+def extract_sor(pdf_path, workers=None, pages_per_chunk=None, cache=None):
+    return items_to_sor(extract_structured_items_from_pdf(pdf_path, workers, pages_per_chunk, cache))
+
 
-            if capture_next_lines:
-                if len(header_lines) < 6:
-                    header_lines.append(line)
-                    continue
-                else:
-                    current_header = " ".join(header_lines).strip()
-                    capture_next_lines = False
-                    continue
-
-            match = pattern_item.match(line)
-            if match:
-                item_no = match.group(1)
-                remaining = line.replace(item_no, '').strip()
-
-                unit, rate = '', ''
-                match_rate = pattern_rate.search(line)
-                if match_rate:
-                    unit = match_rate.group(1) or ''
-                    rate = match_rate.group(2)
-                    remaining = remaining.replace(match_rate.group(0), '').strip()
-
-                data.append({
-                    "Item No.": item_no,
-                    "Header": current_header,
-                    "Description": remaining,
-                    "Unit": unit,
-                    "Rate (S$)": rate
-                })
-
-    return pd.DataFrame(data)
+# Whole document as one DataFrame, built column by column from the classified lines
+def extract_structured_items_from_pdf(pdf_path, workers=None, pages_per_chunk=None, cache=None):
+    if cache is not None:
+        lines = _iter_cached_lines(pdf_path, cache, workers, pages_per_chunk)
+    elif not workers or workers <= 1:
+        lines = iter_page_lines(pdf_path)
+    else:
+        lines = _iter_parallel_lines(pdf_path, workers, pages_per_chunk)
+    return items_frame(lines)
@@ -0,0 +1,97 @@
+# sqlite_cache.py
+
+import os
+import sqlite3
+
+# SQLite limits the number of ? parameters per statement
+_CHUNK = 500
+
+
+# The SQLite side of the match and extraction caches: one database file in
+# directory, opened on first use (worker processes reopen it themselves),
+# lookups over any number of keys, least-recently-used trimming and the
+# hit / miss / eviction counters. Subclasses create their tables in _create,
+# each with a last_used column, and list them in TABLES.
+class SQLiteCache:
+    TABLES = ()
+
+    def __init__(self, directory, filename):
+        self.directory = directory
+        self.path = os.path.join(self.directory, filename)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create(self._conn)
+            self._conn.commit()
+        return self._conn
+
+    def _create(self, conn):
+        raise NotImplementedError
+
+    # Rows of sql run for keys a chunk at a time: "{marks}" in sql becomes the
+    # chunk's placeholders, and params are bound before the chunk's keys
+    def _select_in(self, sql, keys, params=()):
+        conn = self._connect()
+        keys = list(keys)
+        for start in range(0, len(keys), _CHUNK):
+            chunk = keys[start:start + _CHUNK]
+            yield from conn.execute(sql.format(marks=",".join("?" * len(chunk))), [*params, *chunk])
+
+    # _select_in for statements without results (UPDATE / DELETE)
+    def _execute_in(self, sql, keys, params=()):
+        for _ in self._select_in(sql, keys, params):
+            pass
+
+    # Drop the least recently used rows of table until the sum of size (a
+    # column, or 1 to count rows) is at most limit
+    def _evict(self, table, limit, size="1"):
+        conn = self._connect()
+        total = conn.execute(f"SELECT COALESCE(SUM({size}), 0) FROM {table}").fetchone()[0]
+        if total <= limit:
+            return
+        doomed = []
+        rows = conn.execute(f"SELECT rowid, {size} FROM {table} ORDER BY last_used")
+        for rowid, row_size in rows:
+            if total <= limit:
+                break
+            doomed.append(rowid)
+            total -= row_size
+        rows.close()
+        self._execute_in(f"DELETE FROM {table} WHERE rowid IN ({{marks}})", doomed)
+        conn.commit()
+        self.evictions += len(doomed)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "path": self.path,
+        }
+
+    def clear(self):
+        conn = self._connect()
+        for table in self.TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # Worker processes reopen the database themselves
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
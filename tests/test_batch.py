@@ -0,0 +1,28 @@
+# tests/test_batch.py
+
+import pytest
+
+pytest.importorskip("fitz")
+
+from batch import run_batch
+from benchmarks import synthetic
+
+
+def test_pdf_is_extracted_once_for_the_whole_batch(tmp_path):
+    paths = [synthetic.make_workbook(str(tmp_path / f"input{n}.xlsx"), acmv_rows=60, sor_count=2, headers=3, seed=n)
+             for n in range(3)]
+    pdf = synthetic.make_pdf(str(tmp_path / "sor.pdf"), pages=2)
+    log = []
+    manifest = run_batch(paths, str(tmp_path / "out"), jobs=2, options={"pdfs": {"SOR 3 (Vendor 3)": pdf}}, log=log.append)
+    assert manifest["ok"] == 3
+    assert sum("items extracted" in line for line in log) == 1
+    assert manifest["options"]["pdfs"] == repr({"SOR 3 (Vendor 3)": pdf})
+
+
+def test_unreadable_pdf_fails_every_workbook(tmp_path):
+    paths = [synthetic.make_workbook(str(tmp_path / f"input{n}.xlsx"), acmv_rows=60, sor_count=2, headers=3, seed=n)
+             for n in range(2)]
+    manifest = run_batch(paths, str(tmp_path / "out"), jobs=2,
+                         options={"pdfs": {"SOR 2 (Vendor 2)": str(tmp_path / "missing.pdf")}}, log=lambda line: None)
+    assert manifest["failed"] == 2
+    assert all(entry["status"] == "error" and "missing.pdf" in entry["error"] for entry in manifest["files"])
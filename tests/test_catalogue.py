@@ -0,0 +1,44 @@
+# tests/test_catalogue.py
+
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import final
+from benchmarks import synthetic
+from catalogue import CatalogueStore
+from workbook import OutputBuilder
+
+
+def test_loaded_catalogue_equals_the_imported_frame(tmp_path):
+    df = pd.DataFrame({"HEADER NAME": ["Ducts", "Ducts", "Pumps"], "DESCRIPTION": ["Supply duct", None, "Pump"],
+                       "UNIT": ["m", "m", "No"], "RATE": [12.5, 10.0, 1500.0], "QTY": [1, 2, 3]})
+    store = CatalogueStore(str(tmp_path))
+    store.import_frame("SOR 1 (Vendor)", df)
+    loaded = CatalogueStore(str(tmp_path)).load("SOR 1 (Vendor)")
+    pd.testing.assert_frame_equal(loaded, df.assign(DESCRIPTION=["Supply duct", np.nan, "Pump"]))
+    # Numeric columns are read-only views of the memory-mapped file, not copies
+    assert not loaded["RATE"].to_numpy().flags.writeable
+    assert not loaded["QTY"].to_numpy().flags.writeable
+
+
+def test_main_with_catalogues_matches_main_with_sheets(tmp_path):
+    path = synthetic.make_workbook(str(tmp_path / "input.xlsx"), acmv_rows=120, sor_count=2, headers=4)
+    store = CatalogueStore(str(tmp_path / "catalogues"))
+    for n in (1, 2):
+        store.import_sheet(f"SOR {n} (Vendor {n})", path)
+    outputs = []
+    for catalogues in (None, CatalogueStore(store.directory)):
+        builder = OutputBuilder()
+        with contextlib.redirect_stdout(io.StringIO()):
+            final.main(path, builder, catalogues=catalogues)
+        outputs.append(builder.sheets)
+    expected, sheets = outputs
+    assert list(sheets) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(sheets[name], expected[name])
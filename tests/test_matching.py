@@ -0,0 +1,124 @@
+# tests/test_matching.py
+
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from fuzzywuzzy import fuzz, process
+
+import final
+from benchmarks import bench, synthetic
+from match_cache import MatchCache
+from matching import Blocking, blocking_recall
+
+
+# final.compare as it was before matching was batched: one
+# process.extractOne(..., scorer=fuzz.partial_ratio) per ACMV row, taking the
+# first d3 row whose cleaned description is the match
+def extract_one_compare(acmv_df, d3_df, prefix):
+    acmv_df = acmv_df[["HEADER NAME", "DESCRIPTION", "UNIT", "RATE"]].copy()
+    d3_df = d3_df.copy()
+    pdesc = f"{prefix}"
+    prate = f"{prefix} RATE"
+    acmv_df[pdesc] = None
+    acmv_df[prate] = None
+    acmv_df['Score'] = None
+    d3_df['Clean Description'] = final.clean_description_column(d3_df)
+    matched_descriptions = []
+    for index, row in acmv_df.iterrows():
+        acmv_description = str(row['DESCRIPTION'])
+        if pd.isna(acmv_description) or not str(acmv_description).strip():
+            continue
+        match = process.extractOne(acmv_description, d3_df['Clean Description'].tolist(), scorer=fuzz.partial_ratio)
+        if match is None:
+            continue
+        matching_row = d3_df[d3_df['Clean Description'] == match[0]]
+        if not matching_row.empty:
+            acmv_df.at[index, pdesc] = matching_row['DESCRIPTION'].values[0]
+            acmv_df.at[index, prate] = matching_row['RATE'].values[0]
+            acmv_df.at[index, 'Score'] = match[1]
+            matched_descriptions.append(matching_row['DESCRIPTION'].values[0])
+    copied_d3 = d3_df[d3_df['DESCRIPTION'].isin(matched_descriptions)].drop(columns='Clean Description')
+    return acmv_df, copied_d3
+
+
+WORDS = ["supply", "install", "duct", "chiller", "pump", "valve", "fan", "coil", "unit", "pipe",
+         "insulation", "damper", "grille", "sensor", "panel", "motor", "100mm", "150mm", "dia", "x"]
+
+
+def description(rng, words):
+    return " ".join(rng.choice(words) for _ in range(rng.randint(1, 5)))
+
+
+# ACMV and SOR groups drawn from a small vocabulary, so many scores tie and
+# descriptions repeat. Some SOR rows share a prefix (removed by the cleaning
+# step); some ACMV rows are blank, whitespace, NaN or punctuation only.
+def make_groups(seed):
+    rng = random.Random(seed)
+    words = rng.sample(WORDS, rng.randint(3, len(WORDS)))
+    d3 = [description(rng, words) for _ in range(rng.randint(1, 30))]
+    d3 += [rng.choice(d3) for _ in range(rng.randint(0, 5))]
+    d3 += [f"common prefix {description(rng, words)}" for _ in range(rng.randint(0, 4))]
+    rng.shuffle(d3)
+    acmv = [description(rng, words) for _ in range(rng.randint(1, 30))]
+    acmv += [rng.choice(d3) for _ in range(rng.randint(0, 5))]
+    acmv += rng.sample(["", "   ", np.nan, "-", "?!"], rng.randint(0, 3))
+    rng.shuffle(acmv)
+    acmv_df = pd.DataFrame({"HEADER NAME": "Group", "DESCRIPTION": acmv, "UNIT": "m",
+                            "RATE": [float(n) for n in range(len(acmv))]}, index=range(100, 100 + len(acmv)))
+    d3_df = pd.DataFrame({"HEADER NAME": "Group", "DESCRIPTION": d3, "UNIT": "m",
+                          "RATE": [float(1000 + n) for n in range(len(d3))]}, index=range(500, 500 + len(d3)))
+    return acmv_df, d3_df
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_compare_matches_extract_one(seed):
+    acmv_df, d3_df = make_groups(seed)
+    expected_acmv, expected_d3 = extract_one_compare(acmv_df, d3_df, "SOR 1")
+    updated_acmv, copied_d3 = final.compare(acmv_df, d3_df, "SOR 1")
+    pd.testing.assert_frame_equal(updated_acmv, expected_acmv)
+    pd.testing.assert_frame_equal(copied_d3, expected_d3)
+
+
+# The same through the match cache, filled on the first run and read on the second
+@pytest.mark.parametrize("seed", range(10))
+def test_cached_compare_matches_extract_one(seed, tmp_path):
+    acmv_df, d3_df = make_groups(seed)
+    expected_acmv, expected_d3 = extract_one_compare(acmv_df, d3_df, "SOR 1")
+    cache = MatchCache(str(tmp_path))
+    for _ in range(2):
+        updated_acmv, copied_d3 = final.compare(acmv_df, d3_df, "SOR 1", cache=cache)
+        pd.testing.assert_frame_equal(updated_acmv, expected_acmv)
+        pd.testing.assert_frame_equal(copied_d3, expected_d3)
+    assert cache.hits
+
+
+def test_blocking_recall_measures_what_blocking_gives_up():
+    acmv_group, sor_group = synthetic.make_group(80, 80, similarity=0.5)
+    queries = [str(d) for d in acmv_group["DESCRIPTION"]]
+    corpus = final.choice_corpus(sor_group)
+
+    # Scoring every candidate is exhaustive matching
+    complete = blocking_recall(queries, corpus, Blocking(top_k=len(corpus), full_scan_fallback=False))
+    assert (complete["recall"], complete["score_recall"]) == (1.0, 1.0)
+
+    narrow = blocking_recall(queries, corpus, Blocking(top_k=1, full_scan_fallback=False))
+    assert narrow["queries"] == len(queries)
+    assert narrow["recall"] <= narrow["score_recall"] < 1.0
+    assert narrow["pairs_scored"] < narrow["pairs_exhaustive"] == len(queries) * len(corpus)
+    assert narrow["full_scans"] == 0
+
+    # Falling back to a full scan for every weak candidate can only recover matches
+    fallback = blocking_recall(queries, corpus, Blocking(top_k=1, fallback_score=100))
+    assert fallback["score_recall"] == 1.0 and fallback["full_scans"] > 0
+
+
+def test_benchmark_reports_blocking_recall_and_flags_a_drop():
+    results = bench.run(repeat=1, only=["match.blocking"])
+    report = results["scenarios"]["match.blocking"]["report"]
+    assert 0.0 <= report["recall"] <= 1.0
+    assert bench.find_regressions(results, results, 0.2) == []
+    worse = {"scenarios": {"match.blocking": {**results["scenarios"]["match.blocking"],
+                                               "report": {**report, "recall": report["recall"] - 0.1}}}}
+    assert [r[1] for r in bench.find_regressions(worse, results, 0.2)] == ["recall"]
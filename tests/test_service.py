@@ -0,0 +1,52 @@
+# tests/test_service.py
+
+import http.client
+import json
+import threading
+
+import pytest
+
+import service
+from jobs import JobManager
+
+
+@pytest.fixture
+def server(tmp_path):
+    manager = JobManager(1, str(tmp_path / "results"), max_queued=1, quiet=True)
+    server = service.ComparisonServer(("127.0.0.1", 0), manager, max_upload_bytes=1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    manager.shutdown()
+
+
+# (status, JSON body) of POST /jobs sent with the given Content-Length header
+def post(server, length, body=b""):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    try:
+        conn.putrequest("POST", "/jobs")
+        conn.putheader("Content-Length", length)
+        conn.endheaders(body)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5", ""])
+def test_invalid_content_length_is_rejected(server, length):
+    status, body = post(server, length)
+    assert status == 400
+    assert "Content-Length" in body["error"]
+
+
+def test_upload_over_the_limit_is_rejected(server):
+    status, body = post(server, "2048", b"x" * 2048)
+    assert status == 413
+    assert "1024" in body["error"]
+
+
+def test_empty_upload_is_rejected(server):
+    assert post(server, "0")[0] == 400
@@ -0,0 +1,114 @@
+# tests/test_sor_converter.py
+
+import random
+
+import pandas as pd
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import sor_converter
+from benchmarks import synthetic
+from extraction_cache import ExtractionCache
+
+
+# The synthetic SOR PDF with every page wrapped in a Form XObject, as
+# show_pdf_page (and many PDF tools) write them: each page's content stream
+# is just "q /fzFrm0 Do Q"
+def make_form_pdf(tmp_path, pages=6):
+    source = fitz.open(synthetic.make_pdf(str(tmp_path / "source.pdf"), pages))
+    doc = fitz.open()
+    for page_no in range(len(source)):
+        page = doc.new_page(width=source[page_no].rect.width, height=source[page_no].rect.height)
+        page.show_pdf_page(page.rect, source, page_no)
+    path = str(tmp_path / "forms.pdf")
+    doc.save(path)
+    return path
+
+
+def test_form_xobject_pages_get_distinct_keys(tmp_path):
+    with fitz.open(make_form_pdf(tmp_path)) as doc:
+        assert len({doc[0].read_contents(), doc[1].read_contents()}) == 1
+        assert len({sor_converter.page_key(page) for page in doc}) == len(doc)
+
+
+def test_cached_extraction_matches_uncached_for_form_xobject_pages(tmp_path):
+    path = make_form_pdf(tmp_path)
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    expected = sor_converter.extract_structured_items_from_pdf(path)
+    assert sor_converter.extract_structured_items_from_pdf(path, cache=cache).equals(expected)
+    assert sor_converter.extract_structured_items_from_pdf(path, cache=cache).equals(expected)
+
+
+# A re-issue of path with one page inserted at page_no (from a different
+# document) or page_no removed; saving with garbage collection renumbers
+# every object after it
+def reissue(path, tmp_path, page_no, insert):
+    doc = fitz.open(path)
+    if insert:
+        doc.insert_pdf(fitz.open(synthetic.make_pdf(str(tmp_path / "extra.pdf"), 1, seed=9)), start_at=page_no)
+    else:
+        doc.delete_page(page_no)
+    reissued = str(tmp_path / "reissued.pdf")
+    doc.save(reissued, garbage=4)
+    return reissued
+
+
+@pytest.mark.parametrize("forms", [False, True])
+@pytest.mark.parametrize("insert", [True, False])
+def test_untouched_pages_hit_the_cache_after_pages_are_inserted_or_removed(tmp_path, forms, insert):
+    path = make_form_pdf(tmp_path, 12) if forms else synthetic.make_pdf(str(tmp_path / "plain.pdf"), 12)
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    sor_converter.extract_structured_items_from_pdf(path, cache=cache)
+    reissued = reissue(path, tmp_path, 3, insert)
+    with fitz.open(path) as before, fitz.open(reissued) as after:
+        assert before[5].xref != after[5 + (1 if insert else -1)].xref
+
+    cache.hits = cache.misses = 0
+    items = sor_converter.extract_structured_items_from_pdf(reissued, cache=cache)
+    assert (cache.hits, cache.misses) == ((12, 1) if insert else (11, 0))
+    assert items.equals(sor_converter.extract_structured_items_from_pdf(reissued))
+
+
+# Random lines built from the pieces the patterns look for: item numbers and
+# section codes (well-formed or not), units, rates with and without $ or S,
+# odd whitespace and non-ASCII text
+def random_line(rng):
+    pieces = ["A1100010", "B2200005", "A110000", "AB1234", "a1100010", "A11000", "XY123400", "1234567",
+              "Unit", "No", "Set", "Each", "Lot", "m", "kg", "Per Job", "Job", "RT", "kW",
+              "$1,234.00", "S12.50", "$.50", "0.99", "12,345.678", "$ 7.25", "3.5",
+              "supply", "install", "duct", "chiller", "UNIT", "café", "²", "×", "–",
+              "\t", "\x0b", "\x1c", " ", "  ", "-", ",", "(", ")"]
+    line = "".join(rng.choice(pieces) + rng.choice(["", " ", " "]) for _ in range(rng.randint(1, 7)))
+    return line.strip() or "x"
+
+
+def test_parse_lines_matches_parse_line():
+    pytest.importorskip("pyarrow")
+    rng = random.Random(0)
+    lines = [random_line(rng) for _ in range(20000)]
+    lines += ["A110000", "A1100010 supply duct Unit $1,234.00", "A1100010 café m $5.00", "A1100010"]
+    assert sor_converter.parse_lines(lines) == [sor_converter.parse_line(line) for line in lines]
+
+
+# Random classified lines: section codes, items and other text, with codes
+# close together and near the end so headers are cut short
+def random_parsed_lines(rng, count):
+    lines = []
+    for n in range(count):
+        roll = rng.random()
+        if roll < 0.12:
+            lines.append((f"A{n:04d}00", ("header",)))
+        elif roll < 0.6:
+            lines.append((f"item {n}", ("item", f"A{n:07d}", f"description {n}", rng.choice(["", "m", "Unit"]), f"{n}.00")))
+        else:
+            lines.append((f"text {n}", ("text",)))
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_items_frame_matches_iter_items(seed):
+    rng = random.Random(seed)
+    lines = random_parsed_lines(rng, rng.choice([0, 1, 5, 8, 20, 200]))
+    expected = pd.DataFrame(list(sor_converter.iter_items(lines)), columns=sor_converter.ITEM_COLUMNS)
+    assert sor_converter.items_frame(lines).equals(expected)
@@ -0,0 +1,57 @@
+# tests/test_sqlite_cache.py
+
+import pickle
+import time
+
+from extraction_cache import ExtractionCache
+from match_cache import MatchCache
+
+
+def test_lookups_span_more_keys_than_one_statement_takes(tmp_path):
+    cache = MatchCache(str(tmp_path))
+    cache.put_many("group", {f"q{n}": (n, f"match {n}", n % 101) for n in range(1200)})
+    found = cache.get_many("group", [f"q{n}" for n in range(0, 2400, 2)])
+    assert found == {f"q{n}": (n, f"match {n}", n % 101) for n in range(0, 1200, 2)}
+    assert (cache.hits, cache.misses) == (600, 600)
+
+    pages = ExtractionCache(str(tmp_path))
+    pages.put_pages({f"p{n}": [("line", ("text",))] for n in range(1200)})
+    assert pages.contains(f"p{n}" for n in range(0, 2400, 2)) == {f"p{n}" for n in range(0, 1200, 2)}
+    assert len(pages.get_pages([f"p{n}" for n in range(1100, 1300)])) == 100
+
+
+def test_match_cache_drops_the_least_recently_used_entries(tmp_path):
+    cache = MatchCache(str(tmp_path), max_entries=3)
+    for n in range(3):
+        cache.put_many("group", {f"q{n}": (n, None, 50)})
+        time.sleep(0.01)
+    cache.get_many("group", ["q0"])
+    cache.put_many("group", {"q3": (3, None, 50)})
+    assert set(cache.get_many("group", ["q0", "q1", "q2", "q3"])) == {"q0", "q2", "q3"}
+    assert cache.stats()["evictions"] == 1
+    assert len(cache) == 3
+
+
+def test_extraction_cache_keeps_within_max_bytes(tmp_path):
+    lines = [("x" * 100, ("text",))]
+    size = len(pickle.dumps(lines, protocol=pickle.HIGHEST_PROTOCOL))
+    cache = ExtractionCache(str(tmp_path), max_bytes=3 * size)
+    for n in range(3):
+        cache.put_pages({f"p{n}": lines})
+        time.sleep(0.01)
+    cache.get_pages(["p0"])
+    cache.put_pages({"p3": lines})
+    assert cache.contains(["p0", "p1", "p2", "p3"]) == {"p0", "p2", "p3"}
+    stats = cache.stats()
+    assert (stats["evictions"], stats["pages"], stats["bytes"]) == (1, 3, 3 * size)
+
+
+def test_clear_and_reopen(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put_document("doc", ["p0"])
+    cache.put_pages({"p0": []})
+    cache.close()
+    reopened = pickle.loads(pickle.dumps(cache))
+    assert reopened.get_document("doc") == ["p0"]
+    reopened.clear()
+    assert reopened.stats()["pages"] == reopened.stats()["documents"] == 0
@@ -0,0 +1,109 @@
+# tests/test_workbook.py
+
+import io
+import contextlib
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import final
+import workbook
+from benchmarks import synthetic
+from workbook import OutputBuilder, read_sheet, widen
+
+
+# A base sheet that is hard to stream: numbers that turn into text further
+# down, NA text, blank rows inside and after the data, a row wider than the
+# header row and the first data row, and dates
+def make_ragged(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "INPUT 1 (ACMV)"
+    ws.append(["HEADER NAME", "DESCRIPTION", "UNIT", "RATE"])
+    ws.append(["Ducts", "Supply duct", "m", 12.5])
+    ws.append(["Ducts", "Return duct", "m", 10])
+    ws.append([])
+    ws.append(["Pumps", "NA", "No", "N/A"])
+    ws.append(["Pumps", "Chilled water pump", "No", 1500, "extra", None, 7])
+    ws.append(["Fans", None, "Set", "12,5"])
+    ws.append(["Fans", "Axial fan", datetime(2024, 5, 1), 300])
+    ws.append([None, None, None, 42])
+    ws.append([])
+    ws.append([])
+    wb.save(path)
+    return path
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 5000])
+def test_read_sheet_matches_read_excel(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(workbook, "READ_CHUNK_ROWS", chunk_rows)
+    path = make_ragged(str(tmp_path / "ragged.xlsx"))
+    expected = pd.read_excel(path, sheet_name="INPUT 1 (ACMV)")
+    pd.testing.assert_frame_equal(read_sheet(path, "INPUT 1 (ACMV)"), expected)
+    compact = read_sheet(path, "INPUT 1 (ACMV)", categories=["HEADER NAME", "UNIT"])
+    assert isinstance(compact["UNIT"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(widen(compact), expected)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 5000])
+def test_read_sheet_keeps_only_the_requested_columns(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(workbook, "READ_CHUNK_ROWS", chunk_rows)
+    path = make_ragged(str(tmp_path / "ragged.xlsx"))
+    expected = pd.read_excel(path, sheet_name="INPUT 1 (ACMV)")[["DESCRIPTION", "RATE"]]
+    pd.testing.assert_frame_equal(read_sheet(path, "INPUT 1 (ACMV)", columns=["DESCRIPTION", "RATE"]), expected)
+
+
+def test_read_sheet_stops_at_the_memory_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(workbook, "READ_CHUNK_ROWS", 2)
+    path = make_ragged(str(tmp_path / "ragged.xlsx"))
+    with pytest.raises(workbook.MemoryLimitExceeded):
+        read_sheet(path, "INPUT 1 (ACMV)", memory_limit=100)
+
+
+# Every sheet main() leaves in the builder, low_memory or not
+def main_sheets(path, **options):
+    builder = OutputBuilder()
+    with contextlib.redirect_stdout(io.StringIO()):
+        final.main(path, builder, **options)
+    return builder.sheets
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 5000])
+def test_low_memory_main_matches_default(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(workbook, "READ_CHUNK_ROWS", chunk_rows)
+    path = synthetic.make_workbook(str(tmp_path / "input.xlsx"), acmv_rows=120, sor_count=2, headers=4)
+    expected = main_sheets(path)
+    sheets = main_sheets(path, low_memory=True)
+    assert list(sheets) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(widen(sheets[name]), expected[name])
+
+
+def test_low_memory_output_matches_default(tmp_path):
+    path = synthetic.make_workbook(str(tmp_path / "input.xlsx"), acmv_rows=120, sor_count=2, headers=4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = final.compare_workbook(path)
+        output = final.compare_workbook(path, low_memory=True)
+    expected = pd.read_excel(io.BytesIO(expected), sheet_name=None)
+    output = pd.read_excel(io.BytesIO(output), sheet_name=None)
+    assert list(output) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(output[name], expected[name])
+
+
+# Every cell value of every sheet, in order
+def cell_values(path):
+    wb = load_workbook(path)
+    return {ws.title: [[cell.value for cell in row] for row in ws.iter_rows()] for ws in wb}
+
+
+# workers compares the SOR columns in separate processes; the written
+# workbook must not change
+def test_parallel_main_writes_the_same_sheets(tmp_path):
+    path = synthetic.make_workbook(str(tmp_path / "input.xlsx"), acmv_rows=120, sor_count=3, headers=4)
+    for workers, name in ((None, "serial.xlsx"), (2, "parallel.xlsx")):
+        with contextlib.redirect_stdout(io.StringIO()):
+            final.main(path, str(tmp_path / name), workers=workers)
+    assert cell_values(tmp_path / "parallel.xlsx") == cell_values(tmp_path / "serial.xlsx")
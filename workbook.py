@@ -0,0 +1,551 @@
+# workbook.py
+
+import re
+from datetime import date, datetime, timedelta
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.child import avoid_duplicate_name
+from pandas.api.types import is_bool, is_float, is_integer, is_scalar, union_categoricals
+from pandas.io.parsers import TextParser
+
+# Rows parsed at a time by read_sheet
+READ_CHUNK_ROWS = 5000
+
+
+class MemoryLimitExceeded(MemoryError):
+    pass
+
+
+# "512MB", "2G", "1.5 GiB" or a number of bytes -> bytes; None stays None
+def parse_size(size):
+    if size is None or isinstance(size, (int, float)):
+        return None if size is None else int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)(?:I?B)?\s*", size.upper())
+    if not match:
+        raise ValueError(f"Cannot read '{size}' as a size, use e.g. 512MB or 2GB")
+    return int(float(match.group(1)) * 1024 ** " KMGT".index(match.group(2) or " "))
+
+
+# Cell value the way pandas' openpyxl reader converts it
+def _cell_value(cell):
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+# read_excel for one sheet, streamed through openpyxl's read-only mode and
+# parsed READ_CHUNK_ROWS rows at a time with the parser read_excel uses, so
+# only one chunk of raw rows is held at once. Only `columns` are kept (all
+# when None); `categories` become categoricals, the others get read_excel's
+# types. Repeated strings share one object. Raises MemoryLimitExceeded once
+# the frame read so far needs more than memory_limit bytes.
+def read_sheet(source, sheet, columns=None, categories=(), memory_limit=None):
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    memory_limit = parse_size(memory_limit)
+    wb = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb[sheet]
+        ws.reset_dimensions()
+        rows = ws.iter_rows()
+        header = _trimmed([_cell_value(cell) for cell in next(rows, ())])
+        if not header:
+            return pd.DataFrame()
+        strings = {}
+        chunks = []
+        pending = []
+        blank = 0
+        used = 0
+
+        def add_chunk(rows):
+            nonlocal used
+            chunks.append(_parse_chunk(header, rows, columns, categories))
+            used += int(chunks[-1].memory_usage(index=False, deep=True).sum())
+            if memory_limit is not None and used > memory_limit:
+                raise MemoryLimitExceeded(
+                    f"Reading '{sheet}' needs more than the {memory_limit / 2**20:.3g} MB memory limit")
+
+        for row in rows:
+            values = _trimmed([_cell_value(cell) for cell in row])
+            if not values:
+                # Kept only if a row with data follows, like read_excel's trailing row trim
+                blank += 1
+                continue
+            pending.extend([[]] * blank)
+            blank = 0
+            pending.append([strings.setdefault(value, value) if isinstance(value, str) else value
+                            for value in values])
+            if len(pending) >= READ_CHUNK_ROWS:
+                add_chunk(pending)
+                pending = []
+        if pending or not chunks:
+            add_chunk(pending)
+    finally:
+        wb.close()
+    return _combine(chunks, categories)
+
+
+def _trimmed(values):
+    while values and values[-1] == "":
+        values.pop()
+    return values
+
+
+# Raw chunk values with read_excel's NA handling; types are inferred per column in _combine
+def _parse_chunk(header, rows, columns, categories):
+    width = max([len(header)] + [len(row) for row in rows])
+    data = [row + [""] * (width - len(row)) for row in [header] + rows]
+    df = TextParser(data, header=0, skip_blank_lines=False, dtype=object).read()
+    if columns is not None:
+        df = df[[column for column in columns if column in df.columns]]
+    for column in df.columns:
+        if column in categories:
+            df[column] = _categorical(df[column])
+    return df
+
+
+# Categories kept as objects, so chunks that only hold numbers, dates or NaN
+# in a column still combine with the chunks that hold text
+def _categorical(values):
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+
+# Chunks -> one frame. Other columns get their type from the whole column,
+# as in a single parse: numeric text only becomes numbers if every value does.
+def _combine(chunks, categories):
+    combined = {}
+    for column in dict.fromkeys(column for chunk in chunks for column in chunk.columns):
+        parts = [chunk[column] if column in chunk.columns else pd.Series(np.nan, index=chunk.index, dtype=object)
+                 for chunk in chunks]
+        if column in categories:
+            parts = [_categorical(part) if not isinstance(part.dtype, pd.CategoricalDtype) else part
+                     for part in parts]
+            combined[column] = pd.Series(union_categoricals(parts, ignore_order=True) if len(parts) > 1 else parts[0])
+        else:
+            values = pd.concat(parts, ignore_index=True)
+            combined[column] = TextParser([[column]] + [[value] for value in values], header=0,
+                                          skip_blank_lines=False).read().iloc[:, 0]
+    return pd.DataFrame(combined, columns=list(combined))
+
+
+# Categorical columns from read_sheet back to the objects read_excel gives
+def widen(df):
+    compact = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if not compact:
+        return df
+    df = df.copy()
+    for column in compact:
+        df[column] = df[column].astype(object)
+    return df
+
+
+# Parses an input workbook once and hands out cached DataFrames per sheet.
+# source is a path, a file-like buffer or the workbook's bytes.
+# With lazy=True (default) a sheet is only read on first access; lazy=False
+# reads every sheet up front. Cached frames are shared, so callers must copy
+# before modifying them.
+class WorkbookLoader:
+    def __init__(self, source, lazy=True):
+        if isinstance(source, (bytes, bytearray)):
+            source = BytesIO(source)
+        self.source = source
+        self._excel = None
+        self._sheets = {}
+        if not lazy:
+            self.sheets()
+
+    def _file(self):
+        if self._excel is None:
+            self._excel = pd.ExcelFile(self.source)
+        return self._excel
+
+    @property
+    def sheet_names(self):
+        return self._file().sheet_names
+
+    def sheet(self, name):
+        if name not in self._sheets:
+            self._sheets[name] = pd.read_excel(self._file(), sheet_name=name)
+        return self._sheets[name]
+
+    # read_sheet on this workbook. A frame of every column is cached in place
+    # of the read_excel one, so sheets() hands it on instead of reading again.
+    def compact_sheet(self, name, columns=None, categories=(), memory_limit=None):
+        df = read_sheet(self.source, name, columns, categories, memory_limit)
+        if columns is None:
+            self._sheets[name] = df
+        return df
+
+    # All sheets as {sheet_name: DataFrame} in workbook order, like sheet_name=None.
+    # compact=True streams the sheets not read yet through read_sheet instead.
+    def sheets(self, compact=False, memory_limit=None):
+        return {name: self.compact_sheet(name, memory_limit=memory_limit)
+                if compact and name not in self._sheets else self.sheet(name)
+                for name in self.sheet_names}
+
+    def close(self):
+        if self._excel is not None:
+            self._excel.close()
+            self._excel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # The open file handle cannot be pickled; cached sheets travel with the loader
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_excel"] = None
+        return state
+
+
+# Accept either a path/buffer or an existing loader
+def open_workbook(source):
+    if isinstance(source, WorkbookLoader):
+        return source
+    return WorkbookLoader(source)
+
+
+# Highlight colours for the ACMV Check columns
+CHECK_FILLS = {
+    "score": "d6b6d6",          # purple: Score diff only
+    "price": "b6c9d6",          # blue: Price diff only
+    "score_price": "f7f7be",    # yellow: both Score and Price diffs
+    "too_many": "92d050",       # green: Too many ACMV
+}
+
+
+# Bits of the integer Check column produced by final.check
+SCORE_FLAG = 1        # weak fuzzy-match score
+PRICE_FLAG = 2        # rates differ by more than 50%
+TOO_MANY_FLAG = 4     # lowest-scoring row of a group with more ACMV than SOR rows
+
+FLAG_NAMES = [(SCORE_FLAG, "Score"), (PRICE_FLAG, "Price"), (TOO_MANY_FLAG, "Too many ACMV")]
+
+# Check text for every flag combination, e.g. 3 -> "Score, Price"
+CHECK_TEXT = {
+    flags: ", ".join(name for bit, name in FLAG_NAMES if flags & bit)
+    for flags in range(1, (SCORE_FLAG | PRICE_FLAG | TOO_MANY_FLAG) + 1)
+}
+
+
+# Check text for a column of flags; no flags (0 / NaN) gives None
+def check_text(flags):
+    values = pd.to_numeric(pd.Series(flags), errors="coerce").fillna(0).astype(int)
+    return values.map(CHECK_TEXT).astype(object).where(values > 0, None)
+
+
+# Fill colour per row for a column of flags (None where nothing is flagged)
+def flag_fill_colors(flags):
+    values = pd.to_numeric(pd.Series(flags), errors="coerce").fillna(0).astype(int).to_numpy()
+    return np.select(
+        [(values & TOO_MANY_FLAG) > 0, (values & (SCORE_FLAG | PRICE_FLAG)) == (SCORE_FLAG | PRICE_FLAG),
+         (values & SCORE_FLAG) > 0, (values & PRICE_FLAG) > 0],
+        [CHECK_FILLS["too_many"], CHECK_FILLS["score_price"], CHECK_FILLS["score"], CHECK_FILLS["price"]],
+        default=None,
+    )
+
+
+# Fill colour for a Check cell's text, or None when it needs no highlight
+def check_fill_color(text):
+    text = str(text).lower()
+    if "too many acmv" in text:
+        return CHECK_FILLS["too_many"]
+    has_score = "score" in text
+    has_price = "price" in text
+    if has_score and has_price:
+        return CHECK_FILLS["score_price"]
+    if has_score:
+        return CHECK_FILLS["score"]
+    if has_price:
+        return CHECK_FILLS["price"]
+    return None
+
+
+# How Check highlighting is written: "cells" fills every flagged cell,
+# "rules" adds a few conditional formatting rules per Check column instead
+HIGHLIGHT_MODES = ("cells", "rules")
+
+# check_fill_color as conditional formatting: (words the Check text must all
+# contain, colour), first match wins
+CHECK_RULES = [
+    (["too many acmv"], CHECK_FILLS["too_many"]),
+    (["score", "price"], CHECK_FILLS["score_price"]),
+    (["score"], CHECK_FILLS["score"]),
+    (["price"], CHECK_FILLS["price"]),
+]
+
+
+def check_highlight_mode(mode):
+    if mode not in HIGHLIGHT_MODES:
+        raise ValueError(f"Unknown highlight mode '{mode}', use one of {', '.join(HIGHLIGHT_MODES)}")
+    return mode
+
+
+# Excel formula for a rule, relative to the first data row (SEARCH ignores case like check_fill_color)
+def check_rule_formula(words, check_cell):
+    tests = [f'ISNUMBER(SEARCH("{word}",{check_cell}))' for word in words]
+    return tests[0] if len(tests) == 1 else f"AND({','.join(tests)})"
+
+
+# Ranges the rules cover: each Check column and the three columns to its left,
+# as (first_col, last_col, check cell of the first data row), 0-based columns
+def check_rule_ranges(check_columns):
+    return [(max(0, col - 3), col, f"${get_column_letter(col + 1)}2") for col in check_columns]
+
+
+# Conditional formatting on an openpyxl worksheet with rows data rows under the header
+def add_check_rules(ws, check_columns, rows):
+    if rows == 0:
+        return
+    for first, last, check_cell in check_rule_ranges(check_columns):
+        cells = f"{get_column_letter(first + 1)}2:{get_column_letter(last + 1)}{rows + 1}"
+        for words, color in CHECK_RULES:
+            fill = PatternFill("solid", fgColor=color, bgColor=color)
+            ws.conditional_formatting.add(cells, FormulaRule(formula=[check_rule_formula(words, check_cell)],
+                                                             fill=fill, stopIfTrue=True))
+
+
+# Positions of the columns whose header contains "check" (case-insensitive)
+def check_column_positions(columns):
+    return [pos for pos, name in enumerate(columns) if name and "check" in str(name).lower()]
+
+
+# Positions of the integer flag columns check() adds, all named exactly "Check".
+# Other headers containing "check" (e.g. a SOR named "Checkpoint") hold data.
+def check_flag_positions(columns):
+    return [pos for pos, name in enumerate(columns) if name == "Check"]
+
+
+def default_engine():
+    try:
+        import xlsxwriter  # noqa: F401
+        return "xlsxwriter"
+    except ImportError:
+        return "openpyxl"
+
+
+# Collects every output sheet, the sheet order and the Check highlighting in
+# memory, then writes the workbook in one pass. main(), color_check_cells()
+# and copy_sheet() accept a builder wherever they take the output path.
+# constant_memory writes with xlsxwriter row by row (see write_rows) instead
+# of through to_excel, which keeps every cell of the workbook until it is closed.
+class OutputBuilder:
+    def __init__(self, constant_memory=False):
+        self.constant_memory = constant_memory
+        self.sheets = {}
+        self.highlights = {}
+        self.highlight_modes = {}
+        self.flag_columns = {}
+
+    @property
+    def sheet_names(self):
+        return list(self.sheets)
+
+    # if_sheet_exists follows pd.ExcelWriter: 'replace' keeps the old position,
+    # 'new' picks a free name the way openpyxl does ("ACMV" -> "ACMV1").
+    # flag_columns are positions of integer Check flag columns, written as text.
+    def add_sheet(self, name, df, if_sheet_exists="error", flag_columns=None):
+        if name in self.sheets or any(n.lower() == name.lower() for n in self.sheets):
+            if not (if_sheet_exists == "replace" and name in self.sheets):
+                if if_sheet_exists == "new":
+                    name = avoid_duplicate_name(list(self.sheets), name)
+                else:
+                    raise ValueError(f"Sheet '{name}' already exists and if_sheet_exists is set to '{if_sheet_exists}'.")
+        self.sheets[name] = df
+        self.flag_columns[name] = list(flag_columns or [])
+        return name
+
+    def remove_sheet(self, name):
+        self.sheets.pop(name, None)
+        self.highlights.pop(name, None)
+        self.highlight_modes.pop(name, None)
+        self.flag_columns.pop(name, None)
+
+    def move_to_front(self, name):
+        self.sheets = {name: self.sheets[name], **self.sheets}
+
+    # Fill each flagged Check cell and the three cells to its left when writing,
+    # cell by cell or through conditional formatting (see HIGHLIGHT_MODES)
+    def highlight_checks(self, name, check_columns, mode="cells"):
+        self.highlights[name] = list(check_columns)
+        self.highlight_modes[name] = check_highlight_mode(mode)
+
+    # {Check column: fill colour per data row, None where nothing is flagged}.
+    # Flag columns are read directly, text Check columns are parsed.
+    def fill_colors(self, name):
+        df = self.sheets[name]
+        flag_columns = self.flag_columns.get(name, [])
+        colors = {}
+        for col in self.highlights.get(name, []):
+            if col in flag_columns:
+                colors[col] = flag_fill_colors(df.iloc[:, col])
+            else:
+                colors[col] = np.array([None if value is None or (not isinstance(value, str) and pd.isna(value))
+                                        else check_fill_color(value) for value in df.iloc[:, col]], dtype=object)
+        return colors
+
+    # Cells to fill as {(row, col): colour}, 0-based data rows / columns.
+    # A flagged Check cell colours itself and the three cells to its left.
+    def fills(self, name):
+        fills = {}
+        for col, colors in self.fill_colors(name).items():
+            for row in np.flatnonzero(pd.notna(colors)):
+                for c in range(max(0, col - 3), col + 1):
+                    fills[(row, c)] = colors[row]
+        return fills
+
+    # The sheet as it is written: flag columns replaced by their Check text
+    def rendered(self, name):
+        df = self.sheets[name]
+        flag_columns = self.flag_columns.get(name, [])
+        if not flag_columns:
+            return df
+        df = df.copy(deep=False)
+        for col in flag_columns:
+            df.isetitem(col, check_text(df.iloc[:, col]).to_numpy())
+        return df
+
+    # The finished workbook as bytes, without touching the disk
+    def to_bytes(self, engine=None):
+        output = BytesIO()
+        self.write(output, engine)
+        return output.getvalue()
+
+    def write(self, output, engine=None):
+        engine = engine or default_engine()
+        if self.constant_memory and engine == "xlsxwriter":
+            return self.write_rows(output)
+        with pd.ExcelWriter(output, engine=engine) as writer:
+            for name in self.sheets:
+                df = self.rendered(name)
+                df.to_excel(writer, sheet_name=name, index=False)
+                if name in self.highlights:
+                    if self.highlight_modes.get(name) == "rules":
+                        if engine == "xlsxwriter":
+                            _rules_xlsxwriter(writer.book, writer.sheets[name], self.highlights[name], len(df))
+                        else:
+                            add_check_rules(writer.sheets[name], self.highlights[name], len(df))
+                    elif engine == "xlsxwriter":
+                        _fill_xlsxwriter(writer, name, df, self.fills(name))
+                    else:
+                        _fill_openpyxl(writer, name, self.fills(name))
+
+
+    # The workbook written with xlsxwriter in constant_memory mode: each row
+    # goes to a temporary file once written, so only the frames themselves
+    # stay in memory. Cells come out as write() with to_excel and the
+    # xlsxwriter fills would leave them.
+    def write_rows(self, output):
+        import xlsxwriter
+        book = xlsxwriter.Workbook(output, {"constant_memory": True})
+        formats = {}
+        def cell_format(props):
+            key = tuple(sorted(props.items()))
+            if key not in formats:
+                formats[key] = book.add_format(props) if props else None
+            return formats[key]
+        try:
+            for name in self.sheets:
+                df = self.rendered(name)
+                ws = book.add_worksheet(name)
+                for col, column in enumerate(df.columns):
+                    value, num_format = excel_cell(column)
+                    ws.write(0, col, value, cell_format({**EXCEL_HEADER_FORMAT, **num_format}))
+                colors = {}
+                if name in self.highlights:
+                    if self.highlight_modes.get(name) == "rules":
+                        _rules_xlsxwriter(book, ws, self.highlights[name], len(df))
+                    else:
+                        colors = self.fill_colors(name)
+                for row, values in enumerate(df.itertuples(index=False, name=None)):
+                    row_fills = {}
+                    for col, column_colors in colors.items():
+                        if column_colors[row] is not None:
+                            for c in range(max(0, col - 3), col + 1):
+                                row_fills[c] = column_colors[row]
+                    for col, value in enumerate(values):
+                        if col in row_fills:
+                            fill = cell_format({"pattern": 1, "bg_color": f"#{row_fills[col]}"})
+                            if value is None or (not isinstance(value, str) and pd.isna(value)):
+                                ws.write_blank(row + 1, col, None, fill)
+                            else:
+                                ws.write(row + 1, col, value, fill)
+                        else:
+                            value, num_format = excel_cell(value)
+                            ws.write(row + 1, col, value, cell_format(num_format))
+        finally:
+            book.close()
+
+
+# to_excel's header cell format, as pandas passes it to xlsxwriter
+EXCEL_HEADER_FORMAT = {"bold": True, "align": "center", "valign": "top", "top": 1, "right": 1, "bottom": 1, "left": 1}
+
+
+# A frame value as to_excel writes it: (value, format properties)
+def excel_cell(value):
+    if is_scalar(value) and pd.isna(value):
+        return "", {}
+    if is_integer(value):
+        return int(value), {}
+    if is_float(value):
+        value = float(value)
+        return ("inf" if value > 0 else "-inf") if np.isinf(value) else value, {}
+    if is_bool(value):
+        return bool(value), {}
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            raise ValueError("Excel does not support datetimes with timezones")
+        return value, {"num_format": "YYYY-MM-DD HH:MM:SS"}
+    if isinstance(value, date):
+        return value, {"num_format": "YYYY-MM-DD"}
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 86400, {"num_format": "0"}
+    return str(value), {}
+
+
+def _fill_openpyxl(writer, name, fills):
+    ws = writer.sheets[name]
+    styles = {color: PatternFill("solid", fgColor=color) for color in set(fills.values())}
+    for (row, col), color in fills.items():
+        ws.cell(row=row + 2, column=col + 1).fill = styles[color]
+
+
+# xlsxwriter cannot restyle a written cell, so flagged cells are written again with a fill
+def _fill_xlsxwriter(writer, name, df, fills):
+    ws = writer.sheets[name]
+    formats = {color: writer.book.add_format({"pattern": 1, "bg_color": f"#{color}"}) for color in set(fills.values())}
+    for (row, col), color in fills.items():
+        value = df.iat[row, col]
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            ws.write_blank(row + 1, col, None, formats[color])
+        else:
+            if hasattr(value, "item"):
+                value = value.item()
+            ws.write(row + 1, col, value, formats[color])
+
+
+def _rules_xlsxwriter(book, ws, check_columns, rows):
+    if rows == 0:
+        return
+    formats = {color: book.add_format({"pattern": 1, "bg_color": f"#{color}"}) for _, color in CHECK_RULES}
+    for first, last, check_cell in check_rule_ranges(check_columns):
+        for words, color in CHECK_RULES:
+            ws.conditional_format(1, first, rows, last, {"type": "formula", "criteria": f"={check_rule_formula(words, check_cell)}",
+                                                          "format": formats[color], "stop_if_true": True})